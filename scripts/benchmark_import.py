@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Rolloy SCM - Import Benchmark Suite
+
+Runs the stages of one import script (master data, forecasts, actuals,
+purchase orders, shipments) one after another against a scratch database
+and reports, per stage:
+
+    seconds    wall time of the stage, workbook parsing included
+    rows       rows sent in write requests (POST/PATCH/PUT bodies)
+    requests   HTTP requests made
+    rows/s     rows / seconds
+    peak RSS   peak resident memory of the process running the stage
+
+Every stage runs in its own process, so its peak RSS is its own and not the
+high-water mark of an earlier stage. Stages are run in pipeline order, one
+at a time, so the database holds what later stages look up.
+
+--save-baseline writes the results as JSON; --baseline compares a run
+against such a file and exits with status 1 when a stage got slower, used
+more memory (beyond --tolerance) or made more requests. Only compare runs
+of the same script and workbook against the same kind of server, starting
+from an empty database.
+
+Without --workbook a synthetic workbook is generated (see
+generate_sample_workbook.py). Without --url the stages import into a fresh
+in-memory mock_postgrest.py server, optionally with --mock-latency; the
+scripts' built-in targets are hosted projects and are never used.
+
+Usage:
+    python benchmark_import.py --script rest --save-baseline base.json
+    python benchmark_import.py --script rest --baseline base.json
+    python benchmark_import.py --script excel --url http://127.0.0.1:54321 --weeks 520
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import importlib
+import contextlib
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from generate_sample_workbook import generate_workbook
+from mock_postgrest import Faults, MockPostgrest
+from scm_import.cache import file_sha256
+from scm_import.journal import Journal
+from scm_import.manifest import Manifest
+from scm_import.refdata import ReferenceData, SupabaseSource
+from scm_import.rest import DEFAULT_CONCURRENCY
+from scm_import.workbook import WorkbookReader, DEFAULT_CHUNK_ROWS
+
+BASELINE_VERSION = 1
+
+SCRIPTS = {
+    'rest': 'import_data_rest',
+    'v2': 'import_data_v2',
+    'excel': 'import_excel_data',
+}
+
+WRITE_METHODS = {'POST', 'PATCH', 'PUT'}
+
+# Results table: (header, stage field, format, compared with the baseline);
+# header and rows share the widths, a change like ' (+12%)' follows its value
+RESULT_COLUMNS = [
+    ('seconds', 'seconds', '.2f', True),
+    ('rows', 'rows', 'd', False),
+    ('requests', 'requests', 'd', True),
+    ('rows/s', 'rows_per_sec', '.0f', True),
+    ('peak RSS MB', 'peak_rss_mb', '.1f', True),
+]
+VALUE_WIDTH = 11
+CHANGE_WIDTH = 9
+
+
+class RequestCounter:
+    """Counts the HTTP requests, and the rows in write bodies, of this process"""
+
+    def __init__(self):
+        self.requests = 0
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def record(self, method: str, body):
+        rows = 0
+        if method.upper() in WRITE_METHODS and body:
+            try:
+                data = json.loads(body)
+            except ValueError:
+                data = None
+            rows = len(data) if isinstance(data, list) else int(data is not None)
+        with self._lock:
+            self.requests += 1
+            self.rows += rows
+
+    def install(self):
+        """Wrap requests (RestClient) and httpx (supabase-py) so every send is counted"""
+        import requests
+        counter = self
+        send = requests.Session.send
+
+        def counted_send(session, request, **kwargs):
+            counter.record(request.method, request.body)
+            return send(session, request, **kwargs)
+        requests.Session.send = counted_send
+
+        try:
+            import httpx
+        except ImportError:
+            return
+        httpx_send = httpx.Client.send
+
+        def counted_httpx_send(client, request, **kwargs):
+            counter.record(request.method, request.content)
+            return httpx_send(client, request, **kwargs)
+        httpx.Client.send = counted_httpx_send
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def load_script(script: str, url: str, key: str, workbook: str):
+    """Import one of the import scripts and point it at url and workbook"""
+    # The scripts read their target from the environment at import time
+    os.environ['IMPORT_SUPABASE_URL'] = url
+    os.environ['IMPORT_SUPABASE_KEY'] = key
+    mod = importlib.import_module(SCRIPTS[script])
+    mod.EXCEL_FILE = workbook
+    return mod
+
+
+def build_pipeline(mod, script: str, xlsx: Optional[WorkbookReader], stable_ids: bool = False):
+    """The script's pipeline; without xlsx only its stage names are of use"""
+    if script == 'excel':
+        supabase = mod.get_supabase_client() if xlsx is not None else None
+        # Like the manifest and journal, reference ids are not kept between runs
+        return mod.build_pipeline(supabase, xlsx, Manifest(None), Journal(), ReferenceData(SupabaseSource(supabase)))
+    return mod.build_pipeline(xlsx, stable_ids=stable_ids)
+
+
+def run_stage(args) -> dict:
+    """Worker: run one stage in this process and measure it"""
+    mod = load_script(args.script, args.url, args.key, args.workbook)
+    if hasattr(mod, 'client'):
+        mod.client.set_concurrency(args.concurrency)
+    xlsx = WorkbookReader(args.workbook, chunk_size=args.chunk_size)
+    stage = build_pipeline(mod, args.script, xlsx, args.stable_ids).stages[args.worker]
+
+    counter = RequestCounter()
+    counter.install()
+    output = sys.stderr if args.verbose else open(os.devnull, 'w')
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        stage.func()
+    seconds = time.perf_counter() - started
+
+    return {
+        'seconds': round(seconds, 4),
+        'rows': counter.rows,
+        'requests': counter.requests,
+        'rows_per_sec': round(counter.rows / seconds, 1) if seconds > 0 else 0.0,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def run_benchmark(args, stage_names: List[str]) -> Dict[str, dict]:
+    """Run every stage in its own worker process, in pipeline order"""
+    results = {}
+    for name in stage_names:
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            result_path = f.name
+        command = [
+            sys.executable, os.path.abspath(__file__), '--worker', name, '--result', result_path,
+            '--script', args.script, '--url', args.url, '--key', args.key,
+            '--workbook', args.workbook, '--concurrency', str(args.concurrency),
+        ]
+        command += ['--chunk-size', str(args.chunk_size)]
+        if args.stable_ids:
+            command.append('--stable-ids')
+        if args.verbose:
+            command.append('--verbose')
+
+        print(f"  - {name} ...", flush=True)
+        try:
+            proc = subprocess.run(command)
+            if proc.returncode != 0:
+                raise RuntimeError(f"Stage {name} failed (exit status {proc.returncode})")
+            with open(result_path, encoding='utf-8') as f:
+                results[name] = json.load(f)
+        finally:
+            os.remove(result_path)
+    return results
+
+
+def totals(stages: Dict[str, dict]) -> dict:
+    seconds = sum(s['seconds'] for s in stages.values())
+    rows = sum(s['rows'] for s in stages.values())
+    return {
+        'seconds': round(seconds, 4),
+        'rows': rows,
+        'requests': sum(s['requests'] for s in stages.values()),
+        'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else 0.0,
+        'peak_rss_mb': max((s['peak_rss_mb'] for s in stages.values()), default=0.0),
+    }
+
+
+def change(new: float, old: float) -> str:
+    if not old:
+        return ''
+    return f" ({(new - old) / old * 100:+.0f}%)"
+
+
+def print_results(stages: Dict[str, dict], baseline: Optional[dict] = None):
+    """Print the results table, with the change against the baseline if given"""
+    old = baseline['stages'] if baseline else {}
+    rows = dict(stages, total=totals(stages))
+    if baseline:
+        old = dict(old, total=baseline.get('total', totals(old)))
+    width = max(len(name) for name in rows)
+
+    header = ''.join(f"  {label:>{VALUE_WIDTH}}" + ' ' * (CHANGE_WIDTH if compared else 0)
+                     for label, _, _, compared in RESULT_COLUMNS)
+    print(f"\n  {'stage':<{width}}{header}".rstrip())
+    for name, s in rows.items():
+        o = old.get(name, {})
+        cells = ''.join(f"  {s[field]:>{VALUE_WIDTH}{spec}}"
+                        + (f"{change(s[field], o.get(field)):<{CHANGE_WIDTH}}" if compared else '')
+                        for _, field, spec, compared in RESULT_COLUMNS)
+        print(f"  {name:<{width}}{cells}".rstrip())
+
+
+def regressions(stages: Dict[str, dict], baseline: dict, tolerance: float) -> List[str]:
+    """Stages that are slower, bigger or chattier than the baseline"""
+    found = []
+    limit = 1 + tolerance / 100
+    for name, s in stages.items():
+        o = baseline['stages'].get(name)
+        if o is None:
+            continue
+        # Sub-10ms stages are timer noise
+        if s['seconds'] > o['seconds'] * limit and s['seconds'] - o['seconds'] > 0.01:
+            found.append(f"{name}: {s['seconds']:.2f}s vs {o['seconds']:.2f}s")
+        if s['requests'] > o['requests']:
+            found.append(f"{name}: {s['requests']} requests vs {o['requests']}")
+        if s['peak_rss_mb'] > o['peak_rss_mb'] * limit:
+            found.append(f"{name}: peak RSS {s['peak_rss_mb']:.1f} MB vs {o['peak_rss_mb']:.1f} MB")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import stages against a scratch database")
+    parser.add_argument('--script', choices=sorted(SCRIPTS), default='rest',
+                        help='Import script to benchmark (default: %(default)s)')
+    parser.add_argument('--url', default=None,
+                        help='Base URL of a scratch Supabase/PostgREST server to import into '
+                             '(default: a fresh in-memory mock server)')
+    parser.add_argument('--mock-latency', type=float, default=0,
+                        help='Milliseconds the mock server adds to every request (default: %(default)s)')
+    parser.add_argument('--key', default='benchmark', help='API key sent to the server (default: %(default)s)')
+    parser.add_argument('--workbook', default=None,
+                        help='Workbook to import (default: generate one with the size options below)')
+    parser.add_argument('--skus', type=int, default=6, help='Generated SKUs (default: %(default)s)')
+    parser.add_argument('--channels', type=int, default=2, help='Generated channels (default: %(default)s)')
+    parser.add_argument('--weeks', type=int, default=52, help='Generated weeks (default: %(default)s)')
+    parser.add_argument('--batches', type=int, default=20, help='Generated PO batches (default: %(default)s)')
+    parser.add_argument('--shipments', type=int, default=100, help='Generated shipments (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the generated workbook (default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help='Requests in flight for the REST scripts (default: %(default)s)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help='Stream the weekly sheets in chunks of this many rows; 0 reads whole sheets '
+                             '(default: %(default)s)')
+    parser.add_argument('--stable-ids', action='store_true', help='Run the REST scripts with --stable-ids')
+    parser.add_argument('--save-baseline', default=None, help='Write the results to this JSON file')
+    parser.add_argument('--baseline', default=None, help='Compare the results against this JSON file')
+    parser.add_argument('--tolerance', type=float, default=10.0,
+                        help='Percent a stage may get slower or bigger before it counts as a regression '
+                             '(default: %(default)s)')
+    parser.add_argument('--verbose', action='store_true', help="Show the stages' own output")
+    parser.add_argument('--worker', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--result', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_stage(args)
+        with open(args.result, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('version') != BASELINE_VERSION:
+            print(f"Error: {args.baseline} is not a version {BASELINE_VERSION} baseline")
+            sys.exit(2)
+
+    print("=" * 60)
+    print(f"Rolloy SCM - Import Benchmark ({SCRIPTS[args.script]})")
+    print("=" * 60)
+
+    generated = None
+    if args.workbook is None:
+        fd, args.workbook = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        workbook = {'generated': generate_workbook(
+            args.workbook, skus=args.skus, channels=args.channels, weeks=args.weeks,
+            batches=args.batches, shipments=args.shipments, seed=args.seed,
+        )}
+        workbook['generated']['seed'] = args.seed
+        generated = args.workbook
+        print(f"Generated workbook: {workbook['generated']}")
+    else:
+        workbook = {'name': os.path.basename(args.workbook), 'sha256': file_sha256(args.workbook)}
+        print(f"Workbook: {args.workbook}")
+    mock = None
+    if args.url is None:
+        mock = MockPostgrest(port=0, faults=Faults(latency_ms=args.mock_latency)).start()
+        args.url = mock.url
+        server = f'mock (latency {args.mock_latency:g} ms)'
+    else:
+        server = args.url
+    print(f"Target: {server}")
+
+    try:
+        mod = load_script(args.script, args.url, args.key, args.workbook)
+        stage_names = list(build_pipeline(mod, args.script, None, args.stable_ids).stages)
+        print(f"\nRunning {len(stage_names)} stages:")
+        stages = run_benchmark(args, stage_names)
+    finally:
+        if generated:
+            os.remove(generated)
+        if mock is not None:
+            mock.stop()
+
+    print_results(stages, baseline)
+
+    result = {
+        'version': BASELINE_VERSION,
+        'script': args.script,
+        'options': {'server': server, 'concurrency': args.concurrency, 'chunk_size': args.chunk_size,
+                    'stable_ids': args.stable_ids},
+        'workbook': workbook,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'stages': stages,
+        'total': totals(stages),
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if baseline:
+        for field in ('script', 'options', 'workbook'):
+            if baseline.get(field) != result[field]:
+                print(f"\n  ! Baseline {field} differs ({baseline.get(field)}); the comparison is not like for like")
+        found = regressions(stages, baseline, args.tolerance)
+        if found:
+            print(f"\nRegressions against {args.baseline}:")
+            for line in found:
+                print(f"  - {line}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Rolloy SCM - Synthetic Planning Workbook Generator
+
+Writes a workbook with the sheet layout of 供应链计划表(Sample).xlsx, filled
+with random but internally consistent data, so the import scripts can be
+run and benchmarked without the private planning file:
+
+    00其他基础信息       SKUs, channels and warehouse codes
+    01 周度目标销量表    weekly forecast per SKU and channel
+    02 采购下单数据表    purchase order batches
+    03 生产交付数据表    production deliveries per batch
+    04 物流数据表        shipments and their SKU quantities
+    05 周度实际销量表    weekly actual sales per SKU and channel
+
+The first SKUs and channels are the ones the importers map (A2RD ... W1BK,
+亚马逊 and 官网); larger workbooks add synthetic ones, which the importers
+read past like the extra columns of the real file. The same parameters and
+seed always produce the same data.
+
+Usage:
+    python generate_sample_workbook.py --output sample.xlsx
+    python generate_sample_workbook.py --output big.xlsx --skus 40 --weeks 520 --shipments 5000
+"""
+
+import random
+import argparse
+from datetime import date, datetime, timedelta
+from typing import List
+
+from openpyxl import Workbook
+
+BASE_SKUS = ['A2RD', 'A2BK', 'A5RD', 'A5BK', 'W1RD', 'W1BK', 'W2RD', 'W2BK']
+BASE_CHANNELS = ['亚马逊', '官网', '沃尔玛', 'TikTok', 'eBay']
+FBA_WAREHOUSES = ['TEB4', 'ORD2', 'AMA1', 'ONT8', 'LGB4', 'PHX7', 'DFW6', 'SWF1', 'CLT3', 'IND5']
+WINIT_WAREHOUSES = ['WC 90001', 'NJ 07001']
+REGIONS = ['东部', '中部', '西部']
+
+DEFAULT_START = date(2025, 1, 6)
+
+
+def sku_list(count: int) -> List[str]:
+    """The first count SKUs: the real ones, then RD/BK pairs of synthetic SPUs"""
+    skus = BASE_SKUS[:count]
+    spu = 1
+    while len(skus) < count:
+        skus.extend([f'S{spu:02d}RD', f'S{spu:02d}BK'])
+        spu += 1
+    return skus[:count]
+
+
+def channel_list(count: int) -> List[str]:
+    """The first count channels: 亚马逊 and 官网 first, then others"""
+    channels = BASE_CHANNELS[:count]
+    while len(channels) < count:
+        channels.append(f'渠道{len(channels) + 1}')
+    return channels
+
+
+def delivery_column(sku: str, channel: str) -> str:
+    """Column header of sheet 03, which spells W-series SKUs differently"""
+    if sku.startswith('W'):
+        return f'{sku} {channel}' if channel == '亚马逊' else f'{channel} {sku}'
+    return f'{channel}-{sku}'
+
+
+def shipment_column(sku: str, channel: str) -> str:
+    """Column header of sheet 04, where W-series SKUs carry a space"""
+    return f'{sku} {channel}' if sku.startswith('W') else f'{sku}{channel}'
+
+
+def quantity(rng: random.Random, high: int, blank: float = 0.1):
+    """A random quantity, or an empty cell now and then"""
+    return None if rng.random() < blank else rng.randint(0, high)
+
+
+def generate_workbook(path: str, skus: int = 6, channels: int = 2, weeks: int = 52,
+                      batches: int = 20, shipments: int = 100, seed: int = 0,
+                      start: date = DEFAULT_START) -> dict:
+    """Write a synthetic planning workbook to path and return its row counts"""
+    rng = random.Random(seed)
+    sku_names = sku_list(skus)
+    channel_names = channel_list(channels)
+    pairs = [(sku, channel) for channel in channel_names for sku in sku_names]
+    start = datetime(start.year, start.month, start.day)
+
+    # Write-only mode streams rows to disk, so large workbooks stay cheap
+    wb = Workbook(write_only=True)
+
+    ws = wb.create_sheet('00其他基础信息')
+    ws.append(['产品SPU', '产品SKU', '销售渠道', '仓库代号(FBA)', '仓库代号(Winit)'])
+    spus = list(dict.fromkeys(sku[:-2] for sku in sku_names))
+    for i in range(max(len(sku_names), len(channel_names), len(FBA_WAREHOUSES))):
+        ws.append([
+            spus[i] if i < len(spus) else None,
+            sku_names[i] if i < len(sku_names) else None,
+            channel_names[i] if i < len(channel_names) else None,
+            FBA_WAREHOUSES[i] if i < len(FBA_WAREHOUSES) else None,
+            WINIT_WAREHOUSES[i] if i < len(WINIT_WAREHOUSES) else None,
+        ])
+
+    for sheet in ('01 周度目标销量表', '05 周度实际销量表'):
+        ws = wb.create_sheet(sheet)
+        ws.append(['周初', '周末'] + [f'{sku}{channel}' for sku, channel in pairs])
+        for week in range(weeks):
+            monday = start + timedelta(weeks=week)
+            ws.append([monday, monday + timedelta(days=6)] + [quantity(rng, 200) for _ in pairs])
+
+    batch_codes = [f'B{start.year % 100:02d}{i + 1:04d}' for i in range(batches)]
+    ws = wb.create_sheet('02 采购下单数据表')
+    ws.append(['下单批次', '下单日期', '预计出货日期'] + [f'{sku} {channel}' for sku, channel in pairs])
+    for i, batch in enumerate(batch_codes):
+        ordered = start + timedelta(days=7 * i)
+        # A batch is usually ordered over a few rows
+        for _ in range(rng.randint(1, 3)):
+            ws.append([batch, ordered, ordered + timedelta(days=30)]
+                      + [quantity(rng, 500, blank=0.3) for _ in pairs])
+
+    ws = wb.create_sheet('03 生产交付数据表')
+    ws.append(['下单批次', '实际交付日期', '交付单价', '备注']
+              + [delivery_column(sku, channel) for sku, channel in pairs])
+    delivery_rows = 0
+    for i, batch in enumerate(batch_codes):
+        for part in range(rng.randint(1, 2)):
+            delivered = start + timedelta(days=7 * i + 25 + 10 * part)
+            ws.append([batch, delivered, rng.choice([35.0, 40.0, 50.0]), '分批交付' if part else None]
+                      + [quantity(rng, 300, blank=0.4) for _ in pairs])
+            delivery_rows += 1
+
+    ws = wb.create_sheet('04 物流数据表')
+    ws.append(['单号', '仓库', '区域', '报关', '生产批次', '物流批次', '方案', '开船日期',
+               '预计签收日期', '实际签收日期', '预计签收天数', '公斤数', '台数', '公斤单价', '其他杂费']
+              + [shipment_column(sku, channel) for sku, channel in pairs])
+    for i in range(shipments):
+        if rng.random() < 0.8:
+            tracking, warehouse = f'FBA{180000 + i:08d}', rng.choice(FBA_WAREHOUSES)
+        else:
+            tracking, warehouse = f'WN{500000 + i:08d}', rng.choice(WINIT_WAREHOUSES).split()[0]
+        departed = start + timedelta(days=rng.randint(0, 7 * max(weeks, 1)))
+        days = rng.choice([25, 30, 35, 45])
+        # Shipments still at sea have no actual arrival date
+        arrived = departed + timedelta(days=days + rng.randint(-3, 5)) if rng.random() < 0.7 else None
+        qty = [quantity(rng, 100, blank=0.6) for _ in pairs]
+        ws.append([
+            tracking, warehouse, rng.choice(REGIONS), rng.choice(['Y', 'N']),
+            rng.choice(batch_codes) if batch_codes else None, f'L{i // 5 + 1:05d}',
+            rng.choice(['海运', '海运快船', '空运']), departed, departed + timedelta(days=days),
+            arrived, days, round(rng.uniform(50, 2000), 1),
+            sum(q or 0 for q in qty), round(rng.uniform(0.5, 3.0), 2), rng.choice([None, 0, 50, 120]),
+        ] + qty)
+
+    wb.save(path)
+    return {
+        'skus': len(sku_names),
+        'channels': len(channel_names),
+        'weeks': weeks,
+        'batches': batches,
+        'deliveries': delivery_rows,
+        'shipments': shipments,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic 供应链计划表 workbook")
+    parser.add_argument('--output', required=True, help='Path of the .xlsx file to write')
+    parser.add_argument('--skus', type=int, default=6, help='Number of SKUs (default: %(default)s)')
+    parser.add_argument('--channels', type=int, default=2, help='Number of sales channels (default: %(default)s)')
+    parser.add_argument('--weeks', type=int, default=52, help='Weeks of forecasts and actuals (default: %(default)s)')
+    parser.add_argument('--batches', type=int, default=20, help='Purchase order batches (default: %(default)s)')
+    parser.add_argument('--shipments', type=int, default=100, help='Shipments (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: %(default)s)')
+    args = parser.parse_args()
+
+    if args.skus < 1 or args.channels < 1:
+        parser.error('--skus and --channels must be at least 1')
+
+    counts = generate_workbook(args.output, skus=args.skus, channels=args.channels, weeks=args.weeks,
+                               batches=args.batches, shipments=args.shipments, seed=args.seed)
+    print(f"Wrote {args.output}: " + ', '.join(f'{n} {name}' for name, n in counts.items()))
+
+if __name__ == '__main__':
+    main()
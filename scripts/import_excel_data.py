@@ -7,33 +7,50 @@ Import data from 供应链计划表(Sample).xlsx to Supabase
 import os
 import sys
 import json
+import argparse
 import uuid
 from datetime import datetime, timedelta
+from typing import Callable
 import pandas as pd
 from supabase import create_client, Client
 
-# Supabase connection settings
-SUPABASE_URL = os.environ.get('NEXT_PUBLIC_SUPABASE_URL')
-SUPABASE_KEY = os.environ.get('SUPABASE_SERVICE_ROLE_KEY') or os.environ.get('NEXT_PUBLIC_SUPABASE_ANON_KEY')
+from scm_import.dates import parse_date_column, iso_week_columns
+from scm_import.transform import wide_to_long, frame_to_records
+from scm_import.cache import DEFAULT_CACHE_DIR, open_cache, file_sha256
+from scm_import.journal import Journal, default_journal_path, keep_columns
+from scm_import.manifest import Manifest, TableDelta, default_manifest_path
+from scm_import.metrics import RunMetrics, default_report_path, instrument_supabase
+from scm_import.refdata import ReferenceData, SupabaseSource, default_refdata_path
+from scm_import.retry import resilient_supabase
+from scm_import.stages import Pipeline
+from scm_import.stream import stream
+from scm_import.workbook import WorkbookReader, DEFAULT_CHUNK_ROWS, TEXT, NUMBER, RAW
+
+# Supabase connection settings; IMPORT_SUPABASE_URL / IMPORT_SUPABASE_KEY take precedence
+# (e.g. to import into mock_postgrest.py)
+SUPABASE_URL = os.environ.get('IMPORT_SUPABASE_URL') or os.environ.get('NEXT_PUBLIC_SUPABASE_URL')
+SUPABASE_KEY = (os.environ.get('IMPORT_SUPABASE_KEY') or os.environ.get('SUPABASE_SERVICE_ROLE_KEY')
+                or os.environ.get('NEXT_PUBLIC_SUPABASE_ANON_KEY'))
 
 EXCEL_FILE = '/Users/tony/Downloads/供应链计划表(Sample).xlsx'
 
+# Rows per array request in insert_rows()
+BULK_BATCH_SIZE = 1000
+
+# Stage timings, row counts and HTTP calls of this run; reported at the end of main()
+metrics = RunMetrics('import_excel_data')
+
 def get_supabase_client() -> Client:
     """Create Supabase client"""
     if not SUPABASE_URL or not SUPABASE_KEY:
         print("Error: Missing Supabase credentials")
         print("Please set NEXT_PUBLIC_SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY environment variables")
         sys.exit(1)
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
-
-def date_to_iso_week(date_str) -> str:
-    """Convert date to ISO week format YYYY-WXX"""
-    if pd.isna(date_str):
-        return None
-    if isinstance(date_str, str):
-        date_str = pd.to_datetime(date_str)
-    iso_cal = date_str.isocalendar()
-    return f"{iso_cal.year}-W{iso_cal.week:02d}"
+    supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    instrument_supabase(supabase, metrics)
+    # Timeouts, 429 and 5xx are retried with backoff instead of failing the row
+    resilient_supabase(supabase, metrics=metrics)
+    return supabase
 
 def parse_date(date_val):
     """Parse various date formats to YYYY-MM-DD string"""
@@ -53,6 +70,12 @@ def parse_date(date_val):
         return date_val
     return str(date_val)
 
+def add_year_week(df: pd.DataFrame) -> pd.DataFrame:
+    """Add a year_week column from 周初, dropping rows without a usable date"""
+    weeks = iso_week_columns(parse_date_column(df['周初']))
+    df = df.assign(year_week=weeks['week_iso'])
+    return df[df['year_week'].notna()]
+
 def parse_currency(val):
     """Parse currency value like '$2,750.00' to float"""
     if pd.isna(val):
@@ -65,6 +88,186 @@ def parse_currency(val):
     except:
         return 0.0
 
+def insert_rows(supabase: Client, table: str, rows: list, journal: Journal, keep=None) -> list:
+    """
+    Insert rows in array requests of BULK_BATCH_SIZE and return the rows
+    written (their keep columns). Each array is journaled, so a resumed run
+    reads back the rows it already wrote.
+    """
+    rows = list(rows)
+    written = []
+    for i in range(0, len(rows), BULK_BATCH_SIZE):
+        batch = rows[i:i+BULK_BATCH_SIZE]
+        written.extend(run_batch(journal, table, batch, lambda: insert_batch(supabase, table, batch), keep))
+    return written
+
+def run_batch(journal: Journal, table: str, batch: list, send: Callable[[], list], keep=None) -> list:
+    """
+    Return the rows send() wrote for one array. The array is journaled as
+    finished only when every row was written, so a resumed run sends one
+    with failed rows again.
+    """
+    written = []
+
+    def write():
+        nonlocal written
+        written = send()
+        return written if len(written) == len(batch) else None
+
+    done = journal.run(table, batch, write, keep=keep)
+    return keep_columns(written, keep) if done is None else done
+
+def insert_batch(supabase: Client, table: str, batch: list) -> list:
+    """
+    Insert one array of rows and return the rows written. An array that fails
+    is retried one row at a time so only the bad rows are lost.
+    """
+    try:
+        return supabase.table(table).insert(batch).execute().data or []
+    except Exception as e:
+        print(f"  ! Bulk insert into {table} failed ({e}), retrying row by row")
+    metrics.retry('POST', table, len(batch))
+
+    written = []
+    for row in batch:
+        try:
+            result = supabase.table(table).insert(row).execute()
+            written.extend(result.data or [])
+        except Exception as e:
+            print(f"  ! Error inserting into {table}: {e}")
+            metrics.count('rows_failed')
+    return written
+
+def upsert_rows(supabase: Client, table: str, rows: list, on_conflict: str, journal: Journal,
+                label: Callable[[dict], str], keep=None) -> list:
+    """
+    Upsert rows in array requests of BULK_BATCH_SIZE and return the rows
+    written (their keep columns), journaled like insert_rows(). Rows must
+    not repeat a conflict key within one call.
+    """
+    rows = list(rows)
+    written = []
+    for i in range(0, len(rows), BULK_BATCH_SIZE):
+        batch = rows[i:i+BULK_BATCH_SIZE]
+        written.extend(run_batch(journal, table, batch,
+                                 lambda: upsert_batch(supabase, table, batch, on_conflict, label), keep))
+    return written
+
+def upsert_batch(supabase: Client, table: str, batch: list, on_conflict: str,
+                 label: Callable[[dict], str]) -> list:
+    """
+    Upsert one array of rows and return the rows written. As in
+    insert_batch(), an array that fails is retried one row at a time; each
+    row that still fails is reported as label(row).
+    """
+    try:
+        return supabase.table(table).upsert(batch, on_conflict=on_conflict).execute().data or []
+    except Exception as e:
+        print(f"  ! Bulk upsert into {table} failed ({e}), retrying row by row")
+    metrics.retry('POST', table, len(batch))
+
+    written = []
+    for row in batch:
+        try:
+            result = supabase.table(table).upsert(row, on_conflict=on_conflict).execute()
+            written.extend(result.data or [])
+        except Exception as e:
+            print(f"  ! {label(row)}: error upserting into {table}: {e}")
+            metrics.count('rows_failed')
+    return written
+
+def sync_rows(supabase: Client, table: str, rows: list, delta: TableDelta,
+              journal: Journal, keep=None) -> list:
+    """
+    Write rows through a delta: new rows go through insert_rows(), changed
+    rows are updated in place on their natural key, unchanged rows are
+    skipped. With --delta off every row is new. Returns the rows written.
+    """
+    metrics.count('rows_transformed', len(rows))
+    rows = delta.changes(rows)
+    written = insert_rows(supabase, table, [row for row in rows if delta.is_new(row)], journal, keep)
+
+    for row in rows:
+        if delta.is_new(row):
+            continue
+        query = supabase.table(table).update(row)
+        for col, value in delta.key_of(row).items():
+            query = query.eq(col, value)
+        try:
+            result = query.execute()
+            written.extend(result.data or [])
+        except Exception as e:
+            print(f"  ! Error updating {table} {delta.key_of(row)}: {e}")
+            metrics.count('rows_failed')
+
+    delta.confirm(written)
+    return written
+
+def delete_missing(supabase: Client, table: str, delta: TableDelta):
+    """Delete the rows the previous delta run wrote that are no longer in the workbook"""
+    if delta.held:
+        print(f"  ! Not deleting {table} rows that left the workbook: {delta.held}")
+        return
+    missing = delta.missing()
+    if not missing:
+        return
+    print(f"Deleting {len(missing)} {table} rows no longer in the workbook...")
+    for key in missing:
+        query = supabase.table(table).delete()
+        for col, value in key.items():
+            query = query.eq(col, value)
+        try:
+            query.execute()
+            delta.removed(key)
+        except Exception as e:
+            print(f"  ! Error deleting {table} {key}: {e}")
+
+def existing_ids(supabase: Client, table: str, key_cols: tuple) -> dict:
+    """
+    Map natural key -> id for every row of a table, a page at a time
+
+    The server may cap pages below BULK_BATCH_SIZE (db-max-rows), so a short
+    page does not end the table: only an empty page, or reaching the row
+    count of the first response, does.
+    """
+    ids = {}
+    select = ', '.join(('id',) + key_cols)
+    result = supabase.table(table).select(select, count='exact').order('id') \
+        .range(0, BULK_BATCH_SIZE - 1).execute()
+    total = result.count
+    rows = result.data or []
+    start = 0
+    while rows:
+        for row in rows:
+            ids[tuple(row[col] for col in key_cols)] = row['id']
+        start += len(rows)
+        if total is not None and start >= total:
+            break
+        rows = supabase.table(table).select(select).order('id') \
+            .range(start, start + BULK_BATCH_SIZE - 1).execute().data or []
+    return ids
+
+def row_ids(supabase: Client, table: str, rows: list, written: list, delta: TableDelta,
+            journal: Journal) -> dict:
+    """
+    Map natural key -> id for the rows this run built
+
+    Written rows carry their id. With --delta, rows skipped as unchanged were
+    not sent, so their ids are read back from the table. So are those of a
+    resumed run, where rows of the batch in flight at the interruption may
+    already exist and be rejected as duplicates.
+    """
+    ids = {}
+    if delta.enabled or journal.resumed:
+        stored = existing_ids(supabase, table, delta.key_cols)
+        for row in rows:
+            key = tuple(row[col] for col in delta.key_cols)
+            if key in stored:
+                ids[key] = stored[key]
+    for row in written:
+        ids[tuple(row[col] for col in delta.key_cols)] = row['id']
+    return ids
+
 def get_region_from_chinese(region_str):
     """Convert Chinese region to enum value"""
     if pd.isna(region_str):
@@ -76,11 +279,12 @@ def get_region_from_chinese(region_str):
     }
     return region_map.get(str(region_str).strip(), 'Central')
 
-def import_master_data(supabase: Client, xlsx: pd.ExcelFile):
+def import_master_data(supabase: Client, xlsx: WorkbookReader, manifest: Manifest, journal: Journal,
+                       refdata: ReferenceData):
     """Import master data: products, channels, warehouses"""
     print("\n=== Importing Master Data ===")
 
-    df = pd.read_excel(xlsx, sheet_name='00其他基础信息')
+    df = xlsx.read_sheet('00其他基础信息', columns=dict.fromkeys(['产品SKU', '产品SPU', '销售渠道', '仓库代号(FBA)', '仓库代号(Winit)'], TEXT))
 
     # 1. Import Products (SKUs)
     print("\n1. Importing Products...")
@@ -125,13 +329,20 @@ def import_master_data(supabase: Client, xlsx: pd.ExcelFile):
             'is_active': True
         })
 
-    # Upsert products
-    for p in products:
+    # Upsert products (with --delta, only new and changed rows)
+    master = []
+    delta = manifest.table('products', ('sku',))
+    master.append(delta)
+    metrics.count('rows_transformed', len(products))
+    for p in delta.changes(products, replace=True):
         try:
-            supabase.table('products').upsert(p, on_conflict='sku').execute()
+            journal.run('products', [p], lambda: supabase.table('products').upsert(p, on_conflict='sku').execute().data,
+                        keep=('id',))
+            delta.confirm([p])
             print(f"  - Product: {p['sku']}")
         except Exception as e:
             print(f"  ! Error inserting product {p['sku']}: {e}")
+            metrics.count('rows_failed')
 
     # 2. Import Channels
     print("\n2. Importing Channels...")
@@ -143,12 +354,18 @@ def import_master_data(supabase: Client, xlsx: pd.ExcelFile):
         {'channel_code': 'Walmart-US', 'channel_name': 'Walmart US', 'platform': 'Walmart', 'region': 'US'},
     ]
 
-    for c in channel_data:
+    delta = manifest.table('channels', ('channel_code',))
+    master.append(delta)
+    metrics.count('rows_transformed', len(channel_data))
+    for c in delta.changes(channel_data, replace=True):
         try:
-            supabase.table('channels').upsert(c, on_conflict='channel_code').execute()
+            journal.run('channels', [c], lambda: supabase.table('channels').upsert(c, on_conflict='channel_code').execute().data,
+                        keep=('id',))
+            delta.confirm([c])
             print(f"  - Channel: {c['channel_code']}")
         except Exception as e:
             print(f"  ! Error inserting channel {c['channel_code']}: {e}")
+            metrics.count('rows_failed')
 
     # 3. Import Warehouses
     print("\n3. Importing Warehouses...")
@@ -210,12 +427,18 @@ def import_master_data(supabase: Client, xlsx: pd.ExcelFile):
             'is_active': True
         })
 
-    for w in warehouses:
+    delta = manifest.table('warehouses', ('warehouse_code',))
+    master.append(delta)
+    metrics.count('rows_transformed', len(warehouses))
+    for w in delta.changes(warehouses, replace=True):
         try:
-            supabase.table('warehouses').upsert(w, on_conflict='warehouse_code').execute()
+            journal.run('warehouses', [w], lambda: supabase.table('warehouses').upsert(w, on_conflict='warehouse_code').execute().data,
+                        keep=('id',))
+            delta.confirm([w])
             print(f"  - Warehouse: {w['warehouse_code']} ({w['warehouse_type']})")
         except Exception as e:
             print(f"  ! Error inserting warehouse {w['warehouse_code']}: {e}")
+            metrics.count('rows_failed')
 
     # 4. Import Default Supplier
     print("\n4. Importing Suppliers...")
@@ -225,20 +448,33 @@ def import_master_data(supabase: Client, xlsx: pd.ExcelFile):
         'payment_terms_days': 60,
         'is_active': True
     }
-    try:
-        supabase.table('suppliers').upsert(supplier, on_conflict='supplier_code').execute()
-        print(f"  - Supplier: {supplier['supplier_code']}")
-    except Exception as e:
-        print(f"  ! Error inserting supplier: {e}")
+    delta = manifest.table('suppliers', ('supplier_code',))
+    master.append(delta)
+    metrics.count('rows_transformed')
+    for s in delta.changes([supplier], replace=True):
+        try:
+            journal.run('suppliers', [s], lambda: supabase.table('suppliers').upsert(s, on_conflict='supplier_code').execute().data,
+                        keep=('id',))
+            delta.confirm([s])
+            print(f"  - Supplier: {s['supplier_code']}")
+        except Exception as e:
+            print(f"  ! Error inserting supplier: {e}")
+            metrics.count('rows_failed')
+
+    # Master rows are referenced by every other table, so rows that left the
+    # workbook are reported but never deleted
+    for delta in master:
+        left = delta.missing()
+        if left:
+            print(f"  - {len(left)} {delta.name} no longer in the workbook were left in place")
+        refdata.invalidate(delta.name)
 
     print("\nMaster data import complete!")
 
-def import_sales_forecasts(supabase: Client, xlsx: pd.ExcelFile):
+def import_sales_forecasts(supabase: Client, xlsx: WorkbookReader, manifest: Manifest, journal: Journal):
     """Import weekly sales forecasts"""
     print("\n=== Importing Weekly Sales Forecasts ===")
 
-    df = pd.read_excel(xlsx, sheet_name='01 周度目标销量表')
-
     # Column mapping: SKU + Channel
     sku_channel_cols = {
         'A2RD亚马逊': ('A2RD', 'Amazon-US'),
@@ -255,49 +491,49 @@ def import_sales_forecasts(supabase: Client, xlsx: pd.ExcelFile):
         'W1BK官网': ('W1BK', 'Shopify-US'),
     }
 
-    records = []
-    for _, row in df.iterrows():
-        week_start = parse_date(row['周初'])
-        if not week_start:
-            continue
-
-        year_week = date_to_iso_week(row['周初'])
-        if not year_week:
-            continue
-
-        for col, (sku, channel) in sku_channel_cols.items():
-            if col in df.columns:
-                qty = row.get(col)
-                if pd.notna(qty) and qty > 0:
-                    records.append({
-                        'year_week': year_week,
-                        'sku': sku,
-                        'channel_code': channel,
-                        'forecast_qty': int(qty)
-                    })
-
-    # Batch upsert
-    print(f"Inserting {len(records)} forecast records...")
-    batch_size = 100
-    for i in range(0, len(records), batch_size):
-        batch = records[i:i+batch_size]
-        try:
-            supabase.table('weekly_sales_forecasts').upsert(
-                batch,
-                on_conflict='year_week,sku,channel_code'
-            ).execute()
-            print(f"  - Batch {i//batch_size + 1}: {len(batch)} records")
-        except Exception as e:
-            print(f"  ! Error in batch {i//batch_size + 1}: {e}")
-
-    print(f"Sales forecasts import complete! ({len(records)} records)")
-
-def import_sales_actuals(supabase: Client, xlsx: pd.ExcelFile):
+    batch_no = 0
+    delta = manifest.table('weekly_sales_forecasts', ('year_week', 'sku', 'channel_code'))
+    columns = {'周初': RAW, **dict.fromkeys(sku_channel_cols, NUMBER)}
+
+    def transform(df):
+        df = add_year_week(df)
+        records = frame_to_records(wide_to_long(df, sku_channel_cols, ['year_week'], 'forecast_qty'))
+        metrics.count('rows_transformed', len(records))
+        return records
+
+    def upload(records):
+        nonlocal batch_no
+        # The delta is only touched on this thread
+        records = delta.changes(records, replace=True)
+
+        # Batch upsert
+        print(f"Inserting {len(records)} forecast records...")
+        batch_size = 100
+        for i in range(0, len(records), batch_size):
+            batch = records[i:i+batch_size]
+            batch_no += 1
+            try:
+                journal.run('weekly_sales_forecasts', batch, lambda: supabase.table('weekly_sales_forecasts').upsert(
+                    batch,
+                    on_conflict='year_week,sku,channel_code'
+                ).execute().data, keep=('id',))
+                delta.confirm(batch)
+                print(f"  - Batch {batch_no}: {len(batch)} records")
+            except Exception as e:
+                print(f"  ! Error in batch {batch_no}: {e}")
+                metrics.count('rows_failed', len(batch))
+        return len(records)
+
+    # The next chunk is parsed while this one uploads
+    total = sum(stream(xlsx.iter_sheet('01 周度目标销量表', columns=columns), transform, upload))
+
+    delete_missing(supabase, 'weekly_sales_forecasts', delta)
+    print(f"Sales forecasts import complete! ({total} records)")
+
+def import_sales_actuals(supabase: Client, xlsx: WorkbookReader, manifest: Manifest, journal: Journal):
     """Import weekly sales actuals"""
     print("\n=== Importing Weekly Sales Actuals ===")
 
-    df = pd.read_excel(xlsx, sheet_name='05 周度实际销量表')
-
     # Column mapping: SKU + Channel
     sku_channel_cols = {
         'A2RD亚马逊': ('A2RD', 'Amazon-US'),
@@ -314,54 +550,52 @@ def import_sales_actuals(supabase: Client, xlsx: pd.ExcelFile):
         'W1BK官网': ('W1BK', 'Shopify-US'),
     }
 
-    records = []
-    for _, row in df.iterrows():
-        week_start = parse_date(row['周初'])
-        if not week_start:
-            continue
-
-        year_week = date_to_iso_week(row['周初'])
-        if not year_week:
-            continue
-
-        for col, (sku, channel) in sku_channel_cols.items():
-            if col in df.columns:
-                qty = row.get(col)
-                if pd.notna(qty) and qty > 0:
-                    records.append({
-                        'year_week': year_week,
-                        'sku': sku,
-                        'channel_code': channel,
-                        'actual_qty': int(qty)
-                    })
-
-    # Batch upsert
-    print(f"Inserting {len(records)} actual sales records...")
-    batch_size = 100
-    for i in range(0, len(records), batch_size):
-        batch = records[i:i+batch_size]
-        try:
-            supabase.table('weekly_sales_actuals').upsert(
-                batch,
-                on_conflict='year_week,sku,channel_code'
-            ).execute()
-            print(f"  - Batch {i//batch_size + 1}: {len(batch)} records")
-        except Exception as e:
-            print(f"  ! Error in batch {i//batch_size + 1}: {e}")
-
-    print(f"Sales actuals import complete! ({len(records)} records)")
-
-def import_purchase_orders(supabase: Client, xlsx: pd.ExcelFile):
+    batch_no = 0
+    delta = manifest.table('weekly_sales_actuals', ('year_week', 'sku', 'channel_code'))
+    columns = {'周初': RAW, **dict.fromkeys(sku_channel_cols, NUMBER)}
+
+    def transform(df):
+        df = add_year_week(df)
+        records = frame_to_records(wide_to_long(df, sku_channel_cols, ['year_week'], 'actual_qty'))
+        metrics.count('rows_transformed', len(records))
+        return records
+
+    def upload(records):
+        nonlocal batch_no
+        # The delta is only touched on this thread
+        records = delta.changes(records, replace=True)
+
+        # Batch upsert
+        print(f"Inserting {len(records)} actual sales records...")
+        batch_size = 100
+        for i in range(0, len(records), batch_size):
+            batch = records[i:i+batch_size]
+            batch_no += 1
+            try:
+                journal.run('weekly_sales_actuals', batch, lambda: supabase.table('weekly_sales_actuals').upsert(
+                    batch,
+                    on_conflict='year_week,sku,channel_code'
+                ).execute().data, keep=('id',))
+                delta.confirm(batch)
+                print(f"  - Batch {batch_no}: {len(batch)} records")
+            except Exception as e:
+                print(f"  ! Error in batch {batch_no}: {e}")
+                metrics.count('rows_failed', len(batch))
+        return len(records)
+
+    # The next chunk is parsed while this one uploads
+    total = sum(stream(xlsx.iter_sheet('05 周度实际销量表', columns=columns), transform, upload))
+
+    delete_missing(supabase, 'weekly_sales_actuals', delta)
+    print(f"Sales actuals import complete! ({total} records)")
+
+def import_purchase_orders(supabase: Client, xlsx: WorkbookReader, manifest: Manifest, journal: Journal,
+                           refdata: ReferenceData):
     """Import purchase orders from procurement and delivery data"""
     print("\n=== Importing Purchase Orders & Deliveries ===")
 
-    # Read both sheets
-    df_orders = pd.read_excel(xlsx, sheet_name='02 采购下单数据表')
-    df_deliveries = pd.read_excel(xlsx, sheet_name='03 生产交付数据表')
-
     # Get default supplier ID
-    supplier_result = supabase.table('suppliers').select('id').eq('supplier_code', 'SUP001').execute()
-    supplier_id = supplier_result.data[0]['id'] if supplier_result.data else None
+    supplier_id = refdata.id('suppliers', 'SUP001')
 
     # SKU columns mapping
     sku_cols = {
@@ -379,6 +613,11 @@ def import_purchase_orders(supabase: Client, xlsx: pd.ExcelFile):
         'W1BK 官网': ('W1BK', 'Shopify-US'),
     }
 
+    df_orders = xlsx.read_sheet('02 采购下单数据表', columns={
+        '下单批次': TEXT, '下单日期': RAW, '预计出货日期': RAW,
+        **dict.fromkeys(sku_cols, NUMBER),
+    })
+
     # Group orders by batch
     batch_orders = {}
     for idx, row in df_orders.iterrows():
@@ -404,44 +643,50 @@ def import_purchase_orders(supabase: Client, xlsx: pd.ExcelFile):
 
     # Insert POs and PO Items
     print(f"\nInserting {len(batch_orders)} purchase orders...")
-    po_id_map = {}  # batch_code -> po_id
-    po_item_map = {}  # (po_id, sku, channel) -> item_id
+    po_delta = manifest.table('purchase_orders', ('batch_code',))
+    item_delta = manifest.table('purchase_order_items', ('po_id', 'sku', 'channel_code'))
+    delivery_delta = manifest.table('production_deliveries', ('delivery_number',))
 
+    pos = []
     for batch_code, data in batch_orders.items():
-        po_number = f"PO-{batch_code[:20]}"
-        po = {
-            'po_number': po_number,
+        pos.append({
+            'po_number': f"PO-{batch_code[:20]}",
             'batch_code': batch_code,
             'supplier_id': supplier_id,
             'po_status': 'Delivered',
             'actual_order_date': data['order_date'],
             'planned_ship_date': data['ship_date']
-        }
+        })
 
-        try:
-            result = supabase.table('purchase_orders').insert(po).execute()
-            if result.data:
-                po_id = result.data[0]['id']
-                po_id_map[batch_code] = po_id
-                print(f"  - PO: {po_number}")
-
-                # Insert PO items
-                for item in data['items']:
-                    unit_price = 50 if item['sku'].startswith(('A2', 'A5')) else 35
-                    po_item = {
-                        'po_id': po_id,
-                        'sku': item['sku'],
-                        'channel_code': item['channel_code'],
-                        'ordered_qty': item['qty'],
-                        'delivered_qty': 0,
-                        'unit_price_usd': unit_price
-                    }
-                    item_result = supabase.table('purchase_order_items').insert(po_item).execute()
-                    if item_result.data:
-                        key = (po_id, item['sku'], item['channel_code'])
-                        po_item_map[key] = item_result.data[0]['id']
-        except Exception as e:
-            print(f"  ! Error inserting PO {batch_code}: {e}")
+    # Phase 1: all POs in one request, matched back on batch_code
+    written = sync_rows(supabase, 'purchase_orders', pos, po_delta, journal, ('batch_code', 'id'))
+    po_ids = row_ids(supabase, 'purchase_orders', pos, written, po_delta, journal)
+    po_id_map = {key[0]: po_id for key, po_id in po_ids.items()}  # batch_code -> po_id
+
+    # Phase 2: all items of the POs that were written, in one request
+    po_items = []
+    for po in pos:
+        po_id = po_id_map.get(po['batch_code'])
+        if not po_id:
+            if batch_orders[po['batch_code']]['items']:
+                item_delta.hold(f"purchase order {po['batch_code']} has no id")
+            continue
+        print(f"  - PO: {po['po_number']}")
+
+        for item in batch_orders[po['batch_code']]['items']:
+            unit_price = 50 if item['sku'].startswith(('A2', 'A5')) else 35
+            po_items.append({
+                'po_id': po_id,
+                'sku': item['sku'],
+                'channel_code': item['channel_code'],
+                'ordered_qty': item['qty'],
+                'delivered_qty': 0,
+                'unit_price_usd': unit_price
+            })
+
+    written = sync_rows(supabase, 'purchase_order_items', po_items, item_delta, journal, ('po_id', 'sku', 'channel_code', 'id'))
+    # (po_id, sku, channel) -> item_id
+    po_item_map = row_ids(supabase, 'purchase_order_items', po_items, written, item_delta, journal)
 
     # Import Deliveries
     print(f"\n=== Importing Production Deliveries ===")
@@ -462,7 +707,32 @@ def import_purchase_orders(supabase: Client, xlsx: pd.ExcelFile):
         '官网 W1BK': ('W1BK', 'Shopify-US'),
     }
 
-    delivery_count = 0
+    df_deliveries = xlsx.read_sheet('03 生产交付数据表', columns={
+        '下单批次': TEXT, '实际交付日期': RAW, '交付单价': NUMBER, '备注': TEXT,
+        **dict.fromkeys(delivery_sku_cols, NUMBER),
+    })
+
+    # Phase 1: one PO for each delivery batch without one, from its first row
+    new_pos = {}
+    for idx, row in df_deliveries.iterrows():
+        batch_code = str(row['下单批次']).strip()
+        if batch_code not in po_id_map and batch_code not in new_pos:
+            new_pos[batch_code] = {
+                'po_number': f"PO-{batch_code[:20]}-{idx}",
+                'batch_code': batch_code,
+                'supplier_id': supplier_id,
+                'po_status': 'Delivered',
+                'actual_order_date': parse_date(row['实际交付日期'])
+            }
+
+    new_pos = list(new_pos.values())
+    written = sync_rows(supabase, 'purchase_orders', new_pos, po_delta, journal, ('batch_code', 'id'))
+    for key, po_id in row_ids(supabase, 'purchase_orders', new_pos, written, po_delta, journal).items():
+        po_id_map[key[0]] = po_id
+
+    # Phase 2: PO items the deliveries need, then the deliveries themselves
+    deliveries = []
+    missing_items = {}  # (po_id, sku, channel) -> PO item to create
     for idx, row in df_deliveries.iterrows():
         batch_code = str(row['下单批次']).strip()
         delivery_date = parse_date(row['实际交付日期'])
@@ -471,37 +741,33 @@ def import_purchase_orders(supabase: Client, xlsx: pd.ExcelFile):
             unit_price = 50
 
         po_id = po_id_map.get(batch_code)
-        if not po_id:
-            # Create a new PO for this batch
-            po_number = f"PO-{batch_code[:20]}-{idx}"
-            po = {
-                'po_number': po_number,
-                'batch_code': batch_code,
-                'supplier_id': supplier_id,
-                'po_status': 'Delivered',
-                'actual_order_date': delivery_date
-            }
-            try:
-                result = supabase.table('purchase_orders').insert(po).execute()
-                if result.data:
-                    po_id = result.data[0]['id']
-                    po_id_map[batch_code] = po_id
-            except:
-                continue
 
         # Parse deliveries for each SKU
         for col, (sku, channel) in delivery_sku_cols.items():
             if col in df_deliveries.columns:
                 qty = row.get(col)
                 if pd.notna(qty) and qty > 0:
-                    # Find or create PO item
-                    key = (po_id, sku, channel)
-                    po_item_id = po_item_map.get(key)
+                    delivery = {
+                        'delivery_number': f"DEL-{idx:04d}-{sku}",
+                        'sku': sku,
+                        'channel_code': channel,
+                        'delivered_qty': int(qty),
+                        'actual_delivery_date': delivery_date,
+                        'unit_cost_usd': float(unit_price),
+                        'payment_status': 'Pending',
+                        'remarks': row.get('备注') if pd.notna(row.get('备注')) else None
+                    }
+                    if not po_id:
+                        # Still in the workbook, so neither it nor its PO item may be deleted
+                        delivery_delta.keep([delivery])
+                        item_delta.hold(f"purchase order {batch_code} has no id")
+                        continue
 
-                    if not po_item_id:
+                    key = (po_id, sku, channel)
+                    if key not in po_item_map and key not in missing_items:
                         # Create PO item
                         price = 50 if sku.startswith(('A2', 'A5')) else 35
-                        po_item = {
+                        missing_items[key] = {
                             'po_id': po_id,
                             'sku': sku,
                             'channel_code': channel,
@@ -509,45 +775,40 @@ def import_purchase_orders(supabase: Client, xlsx: pd.ExcelFile):
                             'delivered_qty': 0,
                             'unit_price_usd': price
                         }
-                        try:
-                            item_result = supabase.table('purchase_order_items').insert(po_item).execute()
-                            if item_result.data:
-                                po_item_id = item_result.data[0]['id']
-                                po_item_map[key] = po_item_id
-                        except:
-                            continue
-
-                    if po_item_id:
-                        # Create delivery record
-                        delivery_number = f"DEL-{idx:04d}-{sku}"
-                        delivery = {
-                            'delivery_number': delivery_number,
-                            'po_item_id': po_item_id,
-                            'sku': sku,
-                            'channel_code': channel,
-                            'delivered_qty': int(qty),
-                            'actual_delivery_date': delivery_date,
-                            'unit_cost_usd': float(unit_price),
-                            'payment_status': 'Pending',
-                            'remarks': row.get('备注') if pd.notna(row.get('备注')) else None
-                        }
-                        try:
-                            supabase.table('production_deliveries').insert(delivery).execute()
-                            delivery_count += 1
-                        except Exception as e:
-                            pass
+
+                    deliveries.append((key, delivery))
+
+    missing_items = list(missing_items.values())
+    written = sync_rows(supabase, 'purchase_order_items', missing_items, item_delta, journal, ('po_id', 'sku', 'channel_code', 'id'))
+    po_item_map.update(row_ids(supabase, 'purchase_order_items', missing_items, written, item_delta, journal))
+
+    # delivery_number is unique: like the row-by-row inserts, the first row wins
+    pending = {}
+    for key, delivery in deliveries:
+        po_item_id = po_item_map.get(key)
+        if not po_item_id:
+            delivery_delta.keep([delivery])
+        elif delivery['delivery_number'] not in pending:
+            delivery['po_item_id'] = po_item_id
+            pending[delivery['delivery_number']] = delivery
+
+    delivery_count = len(sync_rows(supabase, 'production_deliveries', list(pending.values()), delivery_delta,
+                                   journal, ('delivery_number', 'id')))
+
+    # Children before parents, so no delete is blocked by a reference
+    delete_missing(supabase, 'production_deliveries', delivery_delta)
+    delete_missing(supabase, 'purchase_order_items', item_delta)
+    delete_missing(supabase, 'purchase_orders', po_delta)
 
     print(f"Production deliveries import complete! ({delivery_count} records)")
 
-def import_shipments(supabase: Client, xlsx: pd.ExcelFile):
+def import_shipments(supabase: Client, xlsx: WorkbookReader, manifest: Manifest, journal: Journal,
+                     refdata: ReferenceData):
     """Import shipment/logistics data"""
     print("\n=== Importing Shipments ===")
 
-    df = pd.read_excel(xlsx, sheet_name='04 物流数据表')
-
     # Get warehouse ID map
-    warehouses = supabase.table('warehouses').select('id, warehouse_code').execute()
-    warehouse_map = {w['warehouse_code']: w['id'] for w in warehouses.data}
+    warehouse_map = refdata.ids('warehouses')
 
     # SKU columns
     sku_cols = {
@@ -565,33 +826,40 @@ def import_shipments(supabase: Client, xlsx: pd.ExcelFile):
         'W1BK 官网': 'W1BK',
     }
 
-    shipment_count = 0
+    df = xlsx.read_sheet('04 物流数据表', columns={
+        '单号': TEXT, '仓库': TEXT, '区域': TEXT, '报关': TEXT,
+        '生产批次': TEXT, '物流批次': TEXT, '方案': TEXT,
+        '开船日期': RAW, '预计签收日期': RAW, '实际签收日期': RAW,
+        '预计签收天数': NUMBER, '公斤数': NUMBER, '台数': NUMBER,
+        '公斤单价': NUMBER, '其他杂费': NUMBER,
+        **dict.fromkeys(sku_cols, NUMBER),
+    })
+
+    shipment_delta = manifest.table('shipments', ('tracking_number',))
+    item_delta = manifest.table('shipment_items', ('shipment_id', 'sku'))
+    # tracking_number -> shipment_id; with --delta, unchanged shipments are not
+    # sent, so their ids come from the table
+    shipment_ids = {}
+    if shipment_delta.enabled:
+        for (tracking,), shipment_id in existing_ids(supabase, 'shipments', ('tracking_number',)).items():
+            shipment_ids[tracking] = shipment_id
+
+    # Pass 1, no requests: every shipment, and every warehouse the sheet names that does not exist yet
+    built = []  # (shipment, warehouse_code, [(sku, qty)])
+    new_warehouses = {}  # warehouse_code -> warehouse to create
     for idx, row in df.iterrows():
         tracking = str(row['单号']).strip()
         warehouse_code = str(row['仓库']).strip()
 
-        # Get warehouse ID
-        warehouse_id = warehouse_map.get(warehouse_code)
-        if not warehouse_id:
-            # Try to create warehouse
+        if warehouse_code not in warehouse_map and warehouse_code not in new_warehouses:
             wh_type = 'FBA' if tracking.startswith('FBA') else '3PL'
-            wh = {
+            new_warehouses[warehouse_code] = {
                 'warehouse_code': warehouse_code,
                 'warehouse_name': f'{wh_type} {warehouse_code}',
                 'warehouse_type': wh_type,
                 'region': get_region_from_chinese(row.get('区域')),
                 'is_active': True
             }
-            try:
-                result = supabase.table('warehouses').upsert(wh, on_conflict='warehouse_code').execute()
-                if result.data:
-                    warehouse_id = result.data[0]['id']
-                    warehouse_map[warehouse_code] = warehouse_id
-            except:
-                continue
-
-        if not warehouse_id:
-            continue
 
         # Parse shipment data
         customs = str(row.get('报关', 'N')).upper() == 'Y'
@@ -600,7 +868,7 @@ def import_shipments(supabase: Client, xlsx: pd.ExcelFile):
             'tracking_number': tracking,
             'batch_code': str(row.get('生产批次', '')).strip() if pd.notna(row.get('生产批次')) else None,
             'logistics_batch_code': str(row.get('物流批次', '')).strip() if pd.notna(row.get('物流批次')) else None,
-            'destination_warehouse_id': warehouse_id,
+            'destination_warehouse_id': None,  # set once all warehouses exist
             'customs_clearance': customs,
             'logistics_plan': str(row.get('方案', '')).strip() if pd.notna(row.get('方案')) else None,
             'logistics_region': get_region_from_chinese(row.get('区域')),
@@ -615,42 +883,182 @@ def import_shipments(supabase: Client, xlsx: pd.ExcelFile):
             'payment_status': 'Pending'
         }
 
+        skus = []
+        for col, sku in sku_cols.items():
+            if col in df.columns:
+                qty = row.get(col)
+                if pd.notna(qty) and qty > 0:
+                    skus.append((sku, int(qty)))
+        built.append((shipment, warehouse_code, skus))
+
+    errors = {}  # tracking_number -> why it was not (fully) imported
+
+    # One call creates every missing warehouse
+    if new_warehouses:
+        print(f"Creating {len(new_warehouses)} warehouses: {', '.join(new_warehouses)}")
+        rows = list(new_warehouses.values())
         try:
-            result = supabase.table('shipments').upsert(
-                shipment,
-                on_conflict='tracking_number'
-            ).execute()
-
-            if result.data:
-                shipment_id = result.data[0]['id']
-                shipment_count += 1
-
-                # Insert shipment items
-                for col, sku in sku_cols.items():
-                    if col in df.columns:
-                        qty = row.get(col)
-                        if pd.notna(qty) and qty > 0:
-                            item = {
-                                'shipment_id': shipment_id,
-                                'sku': sku,
-                                'shipped_qty': int(qty)
-                            }
-                            try:
-                                supabase.table('shipment_items').upsert(
-                                    item,
-                                    on_conflict='shipment_id,sku'
-                                ).execute()
-                            except:
-                                pass
-
-                print(f"  - Shipment: {tracking}")
+            data = journal.run('warehouses', rows, lambda: supabase.table('warehouses').upsert(
+                rows,
+                on_conflict='warehouse_code'
+            ).execute().data, keep=('id', 'warehouse_code'))
+            warehouse_map.update({w['warehouse_code']: w['id'] for w in data or []})
         except Exception as e:
-            print(f"  ! Error inserting shipment {tracking}: {e}")
+            print(f"  ! Error creating warehouses: {e}")
+        refdata.invalidate('warehouses')
+
+    # The last row of a tracking number wins, as it did with one upsert per row
+    shipments = {}
+    errors_before = len(errors)
+    for shipment, warehouse_code, _ in built:
+        tracking = shipment['tracking_number']
+        warehouse_id = warehouse_map.get(warehouse_code)
+        if not warehouse_id:
+            errors[tracking] = f"warehouse {warehouse_code} does not exist and could not be created"
+            # Still in the workbook: not to be deleted
+            shipment_delta.keep([shipment])
+            continue
+        shipment['destination_warehouse_id'] = warehouse_id
+        shipments[tracking] = shipment
+    # Repeated tracking numbers merged above are not failures
+    metrics.count('rows_failed', len(errors) - errors_before)
+
+    # Shipments in one array call, then the items that reference them
+    metrics.count('rows_transformed', len(shipments))
+    records = shipment_delta.changes(shipments.values(), replace=True)
+    written = upsert_rows(supabase, 'shipments', records, 'tracking_number', journal,
+                          lambda shipment: f"Shipment {shipment['tracking_number']}",
+                          keep=('id', 'tracking_number'))
+    shipment_delta.confirm(written)
+    for shipment in written:
+        shipment_ids[shipment['tracking_number']] = shipment['id']
+    shipment_count = len(written)
+    sent = {shipment['tracking_number'] for shipment in written}
+    for shipment in records:
+        if shipment['tracking_number'] not in sent:
+            errors[shipment['tracking_number']] = "shipment upsert failed"
+    print(f"  - Upserted {shipment_count} shipments ({len(shipments) - len(records)} unchanged)")
+
+    # Items of shipments with a returned id, or one read back for unchanged shipments
+    items = {}
+    for shipment, _, skus in built:
+        shipment_id = shipment_ids.get(shipment['tracking_number'])
+        if not shipment_id:
+            if skus:
+                item_delta.hold(f"shipment {shipment['tracking_number']} has no id")
+            continue
+        for sku, qty in skus:
+            items[(shipment_id, sku)] = {
+                'shipment_id': shipment_id,
+                'sku': sku,
+                'shipped_qty': qty
+            }
+
+    tracking_of = {shipment_id: tracking for tracking, shipment_id in shipment_ids.items()}
+    metrics.count('rows_transformed', len(items))
+    records = item_delta.changes(items.values(), replace=True)
+    written = upsert_rows(supabase, 'shipment_items', records, 'shipment_id,sku', journal,
+                          lambda item: f"Shipment {tracking_of.get(item['shipment_id'])} item {item['sku']}",
+                          keep=('id', 'shipment_id', 'sku'))
+    item_delta.confirm(written)
+    stored = {(item['shipment_id'], item['sku']) for item in written}
+    failed_items = {}  # tracking_number -> SKUs whose item upsert failed
+    for item in records:
+        if (item['shipment_id'], item['sku']) not in stored:
+            failed_items.setdefault(tracking_of.get(item['shipment_id']), []).append(item['sku'])
+    for tracking, skus in failed_items.items():
+        errors[tracking] = f"items {', '.join(skus)} failed"
+    print(f"  - Upserted {len(written)} shipment items")
+
+    if errors:
+        print(f"  ! {len(errors)} shipments not (fully) imported:")
+        for tracking, reason in errors.items():
+            print(f"    - {tracking}: {reason}")
+
+    delete_missing(supabase, 'shipment_items', item_delta)
+    delete_missing(supabase, 'shipments', shipment_delta)
 
     print(f"Shipments import complete! ({shipment_count} records)")
 
+def build_pipeline(supabase: Client, xlsx: WorkbookReader, manifest: Manifest, journal: Journal,
+                   refdata: ReferenceData) -> Pipeline:
+    """The import stages and the stages each of them waits for"""
+    # Every stage references master data; the rest are independent
+    pipeline = Pipeline(metrics)
+    pipeline.add('master_data', lambda: import_master_data(supabase, xlsx, manifest, journal, refdata))
+    pipeline.add('sales_forecasts', lambda: import_sales_forecasts(supabase, xlsx, manifest, journal),
+                 after=['master_data'])
+    pipeline.add('sales_actuals', lambda: import_sales_actuals(supabase, xlsx, manifest, journal),
+                 after=['master_data'])
+    pipeline.add('purchase_orders', lambda: import_purchase_orders(supabase, xlsx, manifest, journal, refdata),
+                 after=['master_data'])
+    pipeline.add('shipments', lambda: import_shipments(supabase, xlsx, manifest, journal, refdata),
+                 after=['master_data'])
+    return pipeline
+
 def main():
     """Main import function"""
+    parser = argparse.ArgumentParser(description="Import 供应链计划表 into Supabase")
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=DEFAULT_CHUNK_ROWS,
+        help='Stream the weekly sales sheets in chunks of this many rows, parsing the next chunk '
+             'while one uploads; 0 reads whole sheets (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--cache-dir',
+        default=DEFAULT_CACHE_DIR,
+        help='Where parsed sheets are cached, keyed by workbook content (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Parse the workbook without reading or writing the sheet cache'
+    )
+    parser.add_argument(
+        '--delta',
+        action='store_true',
+        help='Only send rows that are new, changed or deleted since the last --delta run'
+    )
+    parser.add_argument(
+        '--manifest',
+        default=None,
+        help='Row fingerprints of the last --delta run (default: one file per Supabase URL under '
+             '$IMPORT_MANIFEST_DIR)'
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='Continue an interrupted run, skipping the batches its journal records as finished '
+             '(an interrupted --delta run is resumed by running --delta again)'
+    )
+    parser.add_argument(
+        '--journal',
+        default=None,
+        help='Journal of finished batches (default: one file per Supabase URL under $IMPORT_JOURNAL_DIR)'
+    )
+    parser.add_argument(
+        '--no-refdata-cache',
+        action='store_true',
+        help='Read the reference tables in full instead of refreshing their ids cached under '
+             '$IMPORT_REFDATA_DIR'
+    )
+    parser.add_argument(
+        '--sequential',
+        action='store_true',
+        help='Run the import stages one at a time (default: stages that do not depend on '
+             'each other run concurrently)'
+    )
+    parser.add_argument(
+        '--report',
+        default=None,
+        help='Where to write the JSON run report (default: one file per run under $IMPORT_REPORT_DIR)'
+    )
+    args = parser.parse_args()
+    if args.resume and args.delta:
+        parser.error('--resume cannot be combined with --delta')
+
     print("=" * 60)
     print("Rolloy SCM - Excel Data Import")
     print("=" * 60)
@@ -666,15 +1074,40 @@ def main():
 
     # Load Excel file
     print(f"Loading Excel file: {EXCEL_FILE}")
-    xlsx = pd.ExcelFile(EXCEL_FILE)
+    cache = None if args.no_cache else open_cache(args.cache_dir)
+    xlsx = WorkbookReader(EXCEL_FILE, chunk_size=args.chunk_size, cache=cache, metrics=metrics)
     print(f"Sheets found: {xlsx.sheet_names}")
 
-    # Import in order
-    import_master_data(supabase, xlsx)
-    import_sales_forecasts(supabase, xlsx)
-    import_sales_actuals(supabase, xlsx)
-    import_purchase_orders(supabase, xlsx)
-    import_shipments(supabase, xlsx)
+    manifest = Manifest(None)
+    journal = Journal()
+    if args.delta:
+        manifest = Manifest(args.manifest or default_manifest_path(SUPABASE_URL))
+        print(f"Delta import against manifest: {manifest.path}")
+    else:
+        journal.open(args.journal or default_journal_path('import_excel_data', SUPABASE_URL), {
+            'workbook': file_sha256(EXCEL_FILE),
+            'target': SUPABASE_URL,
+        }, resume=args.resume)
+
+    # Natural key -> id of the reference tables, shared by every stage and with the other scripts
+    refdata = ReferenceData(SupabaseSource(supabase))
+    refdata.open(None if args.no_refdata_cache else default_refdata_path(SUPABASE_URL))
+
+    pipeline = build_pipeline(supabase, xlsx, manifest, journal, refdata)
+    try:
+        pipeline.run(parallel=not args.sequential)
+    finally:
+        pipeline.report()
+        # An interrupted --delta run keeps what it confirmed, so the next
+        # --delta run picks up where it stopped
+        manifest.save()
+        metrics.finish(args.report or default_report_path('import_excel_data'))
+    journal.finish()
+
+    if manifest.enabled:
+        print("\nDelta summary:")
+        for line in manifest.summary():
+            print(line)
 
     print("\n" + "=" * 60)
     print("Data import complete!")
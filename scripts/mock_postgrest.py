@@ -0,0 +1,758 @@
+#!/usr/bin/env python3
+"""
+Rolloy SCM - Local PostgREST Stand-in
+
+An in-memory server for /rest/v1/<table> with the parts of PostgREST the
+import scripts rely on, so imports can be tested and profiled offline:
+
+- GET with select=, column filters (eq, neq, gt, gte, lt, lte, in, is, with
+  not.), order=, limit/offset and the Range header; --max-rows caps every
+  response like PostgREST's db-max-rows (Supabase: 1000)
+- POST of one object or an array, all or nothing: a unique-key violation
+  rejects the whole request with 409 (code 23505), as PostgreSQL would
+- Prefer: resolution=merge-duplicates / ignore-duplicates with on_conflict=
+  (the primary key 'id' when omitted); an on_conflict that matches no unique
+  key is a 400 (42P10), and a batch hitting one key twice a 500 (21000)
+- Prefer: return=representation (rows as stored, with generated ids) or
+  return=minimal (empty body)
+- PATCH and DELETE with filters
+
+Every table has a uuid 'id' primary key, filled in when a row has none,
+and every insert and update stamps the row's 'updated_at', as the app's
+tables do.
+UNIQUE_KEYS lists the other unique keys of the tables the scripts write;
+--schema adds or replaces them from a JSON file ({"table": [["col", ...]]}).
+Foreign keys, types and defaults other than id are not modelled.
+
+Faults for load profiling are injected before a request is processed:
+--max-inflight and --rate-limit answer 503/429 with Retry-After, --fail-rate
+answers --fail-status, --drop-rate closes the connection without a reply,
+and --latency/--jitter/--row-latency delay every request. --lose-rate
+closes the connection without a reply after the request was applied, as a
+timeout after the commit does: resending such a write must not duplicate it.
+
+Each request is recorded (method, table, status - 0 when dropped - rows
+and bytes in and out, milliseconds, injected fault). GET /_mock/metrics returns the summary per
+table and method (?last=N adds the last N requests), POST /_mock/reset
+empties tables and metrics, and --metrics-file appends every request to a
+JSONL file. A summary is printed on exit.
+
+Point the scripts at it with IMPORT_SUPABASE_URL (any IMPORT_SUPABASE_KEY
+is accepted):
+
+    python scripts/mock_postgrest.py --port 54321 --latency 20 --rate-limit 50
+    IMPORT_SUPABASE_URL=http://127.0.0.1:54321 python scripts/import_data_rest.py
+"""
+
+import re
+import json
+import time
+import uuid
+import random
+import signal
+import argparse
+import threading
+from datetime import datetime, timezone
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse, parse_qsl
+
+# Unique keys besides the primary key 'id', as the import scripts use them
+UNIQUE_KEYS = {
+    'products': [('sku',)],
+    'channels': [('channel_code',)],
+    'warehouses': [('warehouse_code',)],
+    'suppliers': [('supplier_code',)],
+    'purchase_orders': [('po_number',)],
+    'production_deliveries': [('delivery_number',)],
+    'shipments': [('tracking_number',)],
+    'shipment_items': [('shipment_id', 'sku')],
+    'sales_forecasts': [('sku', 'channel_code', 'week_iso')],
+    'sales_actuals': [('sku', 'channel_code', 'week_iso')],
+    'weekly_sales_forecasts': [('year_week', 'sku', 'channel_code')],
+    'weekly_sales_actuals': [('year_week', 'sku', 'channel_code')],
+    'inventory_snapshots': [('sku', 'warehouse_id')],
+}
+
+# Query parameters that are not column filters
+RESERVED_PARAMS = {'select', 'order', 'limit', 'offset', 'on_conflict', 'columns'}
+
+# Recent requests kept for /_mock/metrics?last=N
+RECENT_REQUESTS = 10000
+
+
+class PostgrestError(Exception):
+    """An error answered in PostgREST's JSON error format"""
+
+    def __init__(self, status: int, code: str, message: str, details: Optional[str] = None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+        self.details = details
+
+    def body(self) -> dict:
+        return {'code': self.code, 'details': self.details, 'hint': None, 'message': self.message}
+
+
+class Table:
+    """Rows of one table by id, with an index per unique key"""
+
+    def __init__(self, name: str, unique: Sequence[Sequence[str]] = ()):
+        self.name = name
+        self.rows: Dict[str, dict] = {}
+        self.unique = [('id',)] + [tuple(cols) for cols in unique]
+        self._indexes = {cols: {} for cols in self.unique}  # cols -> key -> id
+
+    @staticmethod
+    def key(row: dict, cols: Tuple[str, ...]):
+        """The row's value of a unique key; None when any column is NULL"""
+        values = tuple(row.get(col) for col in cols)
+        if any(value is None for value in values):
+            return None
+        return json.dumps(values, sort_keys=True, default=str)
+
+    def unique_key(self, cols: Sequence[str]) -> Optional[Tuple[str, ...]]:
+        """The declared unique key made of exactly these columns"""
+        for key in self.unique:
+            if set(key) == set(cols):
+                return key
+        return None
+
+    def find(self, cols: Tuple[str, ...], row: dict) -> Optional[str]:
+        key = self.key(row, cols)
+        return None if key is None else self._indexes[cols].get(key)
+
+    def check_unique(self, row: dict, own_id: Optional[str] = None):
+        """Raise 23505 if row collides with another row on any unique key"""
+        for cols in self.unique:
+            found = self.find(cols, row)
+            if found is not None and found != own_id:
+                constraint = f"{self.name}_pkey" if cols == ('id',) else f"{self.name}_{'_'.join(cols)}_key"
+                values = ', '.join(str(row.get(col)) for col in cols)
+                raise PostgrestError(
+                    409, '23505', f'duplicate key value violates unique constraint "{constraint}"',
+                    f"Key ({', '.join(cols)})=({values}) already exists.",
+                )
+
+    def put(self, row: dict):
+        self.rows[row['id']] = row
+        for cols, index in self._indexes.items():
+            key = self.key(row, cols)
+            if key is not None:
+                index[key] = row['id']
+
+    def remove(self, row_id: str) -> dict:
+        row = self.rows.pop(row_id)
+        for cols, index in self._indexes.items():
+            key = self.key(row, cols)
+            if key is not None and index.get(key) == row_id:
+                del index[key]
+        return row
+
+    def clear(self):
+        self.rows.clear()
+        for index in self._indexes.values():
+            index.clear()
+
+
+def parse_value(text: str):
+    """A filter operand as JSON would hold it"""
+    if text == 'null':
+        return None
+    if text in ('true', 'false'):
+        return text == 'true'
+    return text
+
+
+def compare(value, operand) -> Optional[int]:
+    """-1/0/1 for value against a filter operand, None when either is NULL"""
+    if value is None or operand is None:
+        return None
+    if isinstance(value, bool) or isinstance(operand, bool):
+        a, b = str(value).lower(), str(operand).lower()
+    else:
+        try:
+            a, b = float(value), float(operand)
+        except (TypeError, ValueError):
+            a, b = str(value), str(operand)
+    return (a > b) - (a < b)
+
+
+def split_list(text: str) -> List[str]:
+    """Items of an in.(a,b,"c,d") operand"""
+    return [item[1:-1] if item.startswith('"') else item
+            for item in re.findall(r'"[^"]*"|[^,]+', text)]
+
+
+def row_filter(column: str, expression: str):
+    """Predicate for one column=op.value query parameter"""
+    negate = expression.startswith('not.')
+    if negate:
+        expression = expression[4:]
+    op, _, operand = expression.partition('.')
+
+    if op == 'in':
+        if not (operand.startswith('(') and operand.endswith(')')):
+            raise PostgrestError(400, 'PGRST100', f'"failed to parse filter ({expression})"')
+        values = [parse_value(item) for item in split_list(operand[1:-1])]
+        test = lambda row: any(compare(row.get(column), v) == 0 for v in values)
+    elif op == 'is':
+        target = parse_value(operand)
+        test = lambda row: row.get(column) is target if target is None else row.get(column) == target
+    elif op in ('eq', 'neq', 'gt', 'gte', 'lt', 'lte'):
+        value = parse_value(operand)
+        accept = {'eq': (0,), 'neq': (-1, 1), 'gt': (1,), 'gte': (0, 1), 'lt': (-1,), 'lte': (-1, 0)}[op]
+        test = lambda row: compare(row.get(column), value) in accept
+    else:
+        raise PostgrestError(400, 'PGRST100', f'"failed to parse filter ({op}.{operand})"')
+    return (lambda row: not test(row)) if negate else test
+
+
+def project(row: dict, select: str) -> dict:
+    """The columns of row named by select= (all of them for '*')"""
+    columns = [col.strip() for col in select.split(',') if col.strip()]
+    if not columns or '*' in columns:
+        return dict(row)
+    return {col.split(':')[0]: row.get(col.split(':')[-1]) for col in columns}
+
+
+def updated_at() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='microseconds')
+
+
+def sort_value(value):
+    """Sort key putting NULLs last (first when descending), as PostgreSQL does"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (value is None, 0, value, '')
+    return (value is None, 1, 0, '' if value is None else str(value))
+
+
+def order_key(spec: str):
+    """Sort key and direction list for order=col.desc,col2"""
+    keys = []
+    for part in spec.split(','):
+        column, _, direction = part.partition('.')
+        keys.append((column, direction.startswith('desc')))
+    return keys
+
+
+class Metrics:
+    """Per-request records and running totals per (method, table)"""
+
+    def __init__(self, path: Optional[str] = None):
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8') if path else None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.recent = deque(maxlen=RECENT_REQUESTS)
+            self.totals: Dict[Tuple[str, str], dict] = {}
+
+    def record(self, entry: dict):
+        with self._lock:
+            self.recent.append(entry)
+            total = self.totals.setdefault((entry['method'], entry['table']), {
+                'requests': 0, 'rows_in': 0, 'rows_out': 0, 'bytes_in': 0, 'bytes_out': 0,
+                'status': {}, 'faults': {}, 'ms': [],
+            })
+            total['requests'] += 1
+            for field in ('rows_in', 'rows_out', 'bytes_in', 'bytes_out'):
+                total[field] += entry[field]
+            status = str(entry['status'])
+            total['status'][status] = total['status'].get(status, 0) + 1
+            if entry['fault']:
+                total['faults'][entry['fault']] = total['faults'].get(entry['fault'], 0) + 1
+            total['ms'].append(entry['ms'])
+            if self._file is not None:
+                self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                self._file.flush()
+
+    def summary(self) -> dict:
+        with self._lock:
+            tables = []
+            for (method, table), total in sorted(self.totals.items(), key=lambda item: (item[0][1], item[0][0])):
+                ms = sorted(total['ms'])
+                pick = lambda q: round(ms[min(len(ms) - 1, int(q * len(ms)))], 2) if ms else 0.0
+                tables.append(dict(
+                    {k: v for k, v in total.items() if k != 'ms'},
+                    method=method, table=table,
+                    ms_p50=pick(0.50), ms_p95=pick(0.95), ms_max=round(ms[-1], 2) if ms else 0.0,
+                ))
+            return {'since': self.started, 'requests': sum(t['requests'] for t in tables), 'tables': tables}
+
+    def summary_lines(self) -> List[str]:
+        summary = self.summary()
+        lines = [f"{summary['requests']} requests"]
+        for t in summary['tables']:
+            statuses = ', '.join(f'{code}: {n}' for code, n in sorted(t['status'].items()))
+            faults = ', '.join(f'{kind}: {n}' for kind, n in sorted(t['faults'].items()))
+            lines.append(f"  - {t['method']:<6} {t['table']:<24} {t['requests']:>6} req  "
+                         f"{t['rows_in']:>7} rows in  {t['rows_out']:>7} rows out  "
+                         f"p50 {t['ms_p50']:.1f}ms  p95 {t['ms_p95']:.1f}ms  [{statuses}]"
+                         + (f"  faults [{faults}]" if faults else ''))
+        return lines
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class Faults:
+    """Latency, throttling and failure injection shared by all handler threads"""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, row_latency_ms: float = 0,
+                 rate_limit: float = 0, burst: int = 0, max_inflight: int = 0,
+                 fail_rate: float = 0, fail_status: int = 503, drop_rate: float = 0,
+                 lose_rate: float = 0, seed: Optional[int] = None):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.row_latency = row_latency_ms / 1000
+        self.rate_limit = rate_limit
+        self.burst = burst or max(1, int(rate_limit))
+        self.max_inflight = max_inflight
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.drop_rate = drop_rate
+        self.lose_rate = lose_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._refilled = time.monotonic()
+        self.inflight = 0
+
+    def admit(self) -> Optional[Tuple[str, int, float]]:
+        """Count a request in; (fault, status, retry after seconds) if it is turned away"""
+        with self._lock:
+            if self.max_inflight and self.inflight >= self.max_inflight:
+                return 'overloaded', 503, 1.0
+            if self.rate_limit:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate_limit)
+                self._refilled = now
+                if self._tokens < 1:
+                    return 'throttled', 429, (1 - self._tokens) / self.rate_limit
+                self._tokens -= 1
+            self.inflight += 1
+            return None
+
+    def release(self):
+        with self._lock:
+            self.inflight -= 1
+
+    def roll(self) -> Optional[str]:
+        """'drop', 'fail' or 'lose' for a request picked to misbehave"""
+        with self._lock:
+            draw = self._random.random()
+        if draw < self.drop_rate:
+            return 'drop'
+        if draw < self.drop_rate + self.fail_rate:
+            return 'fail'
+        if draw < self.drop_rate + self.fail_rate + self.lose_rate:
+            return 'lose'
+        return None
+
+    def delay(self, rows: int):
+        with self._lock:
+            jitter = self._random.random() * self.jitter
+        seconds = self.latency + jitter + self.row_latency * rows
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class MockPostgrest:
+    """The stand-in's tables, faults and metrics, served over HTTP"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 54321,
+                 schema: Optional[Dict[str, Sequence[Sequence[str]]]] = None,
+                 faults: Optional[Faults] = None, metrics_file: Optional[str] = None,
+                 max_rows: int = 0):
+        self.schema = dict(UNIQUE_KEYS, **(schema or {}))
+        # Most rows one GET returns, whatever it asks for; 0 for no cap
+        self.max_rows = max_rows
+        self.faults = faults or Faults()
+        self.metrics = Metrics(metrics_file)
+        self.tables: Dict[str, Table] = {}
+        self.lock = threading.RLock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def table(self, name: str) -> Table:
+        if name not in self.tables:
+            self.tables[name] = Table(name, self.schema.get(name, ()))
+        return self.tables[name]
+
+    def reset(self):
+        with self.lock:
+            for table in self.tables.values():
+                table.clear()
+        self.metrics.reset()
+
+    def start(self) -> 'MockPostgrest':
+        """Serve from a background thread"""
+        self._thread = threading.Thread(target=self.server.serve_forever, name='mock-postgrest', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.metrics.close()
+
+    # -- PostgREST semantics -------------------------------------------------
+
+    def select(self, name: str, params: List[Tuple[str, str]], range_header: Optional[str]) -> Tuple[List[dict], int, int]:
+        """Matching rows, their offset and the total number of matches"""
+        query = dict(params)
+        tests = [row_filter(col, expr) for col, expr in params if col not in RESERVED_PARAMS]
+        with self.lock:
+            rows = [row for row in self.table(name).rows.values() if all(test(row) for test in tests)]
+
+        if 'order' in query:
+            for column, descending in reversed(order_key(query['order'])):
+                rows.sort(key=lambda row: sort_value(row.get(column)), reverse=descending)
+
+        total = len(rows)
+        offset = int(query.get('offset', 0))
+        limit = int(query['limit']) if 'limit' in query else None
+        match = re.fullmatch(r'\s*(\d+)-(\d*)\s*', range_header or '')
+        if match:
+            offset = int(match.group(1))
+            if match.group(2):
+                limit = int(match.group(2)) - offset + 1
+        if self.max_rows:
+            limit = min(limit, self.max_rows) if limit is not None else self.max_rows
+        rows = rows[offset:offset + limit if limit is not None else None]
+        select = query.get('select', '*')
+        if select.replace(' ', '') == 'count':
+            return [{'count': total}], 0, 1
+        return [project(row, select) for row in rows], offset, total
+
+    def insert(self, name: str, records: List[dict], resolution: Optional[str],
+               on_conflict: Optional[str], columns: Optional[List[str]]) -> List[dict]:
+        """Insert or upsert records in one transaction; the rows written"""
+        with self.lock:
+            table = self.table(name)
+            target = ('id',)
+            if on_conflict:
+                target = table.unique_key([col.strip().strip('"') for col in on_conflict.split(',')])
+                if target is None:
+                    raise PostgrestError(400, '42P10', 'there is no unique or exclusion constraint '
+                                                       'matching the ON CONFLICT specification')
+            undo = []
+            written = []
+            seen = set()
+            try:
+                for record in records:
+                    if columns is not None:
+                        record = {col: record.get(col) for col in columns}
+                    existing = table.find(target, record) if resolution else None
+                    key = table.key(record, target)
+                    if resolution and key is not None:
+                        if key in seen and resolution == 'merge-duplicates':
+                            raise PostgrestError(500, '21000', 'ON CONFLICT DO UPDATE command cannot '
+                                                              'affect row a second time')
+                        seen.add(key)
+
+                    if existing is not None:
+                        if resolution == 'ignore-duplicates':
+                            continue
+                        old = table.rows[existing]
+                        row = {**old, **record, 'updated_at': updated_at()}
+                        table.check_unique(row, own_id=existing)
+                        table.remove(existing)
+                        undo.append((old, row['id']))
+                    else:
+                        row = {**record, 'updated_at': updated_at()}
+                        if row.get('id') is None:
+                            row['id'] = str(uuid.uuid4())
+                        table.check_unique(row)
+                        undo.append((None, row['id']))
+                    table.put(row)
+                    written.append(row)
+            except PostgrestError:
+                self._rollback(table, undo)
+                raise
+            return [dict(row) for row in written]
+
+    def update(self, name: str, params: List[Tuple[str, str]], changes: dict) -> List[dict]:
+        tests = [row_filter(col, expr) for col, expr in params if col not in RESERVED_PARAMS]
+        with self.lock:
+            table = self.table(name)
+            undo = []
+            written = []
+            try:
+                for row_id, old in list(table.rows.items()):
+                    if not all(test(old) for test in tests):
+                        continue
+                    row = {**old, **changes, 'updated_at': updated_at()}
+                    table.check_unique(row, own_id=row_id)
+                    table.remove(row_id)
+                    table.put(row)
+                    undo.append((old, row['id']))
+                    written.append(row)
+            except PostgrestError:
+                self._rollback(table, undo)
+                raise
+            return [dict(row) for row in written]
+
+    def delete(self, name: str, params: List[Tuple[str, str]]) -> List[dict]:
+        tests = [row_filter(col, expr) for col, expr in params if col not in RESERVED_PARAMS]
+        with self.lock:
+            table = self.table(name)
+            doomed = [row_id for row_id, row in table.rows.items() if all(test(row) for test in tests)]
+            return [table.remove(row_id) for row_id in doomed]
+
+    @staticmethod
+    def _rollback(table: Table, undo: list):
+        for old, new_id in reversed(undo):
+            if new_id in table.rows:
+                table.remove(new_id)
+            if old is not None:
+                table.put(old)
+
+    # -- HTTP ----------------------------------------------------------------
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Send each response in one segment, right away: separate header and
+            # body writes meet delayed ACKs and add ~40ms to every request
+            disable_nagle_algorithm = True
+            wbufsize = 64 * 1024
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+            def do_PATCH(self):
+                self._handle('PATCH')
+
+            def do_DELETE(self):
+                self._handle('DELETE')
+
+            def _reply(self, status: int, body=None, headers: Optional[dict] = None) -> int:
+                data = b'' if body is None else json.dumps(body, ensure_ascii=False, default=str).encode('utf-8')
+                self.send_response(status)
+                if body is not None:
+                    self.send_header('Content-Type', 'application/json; charset=utf-8')
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return len(data)
+
+            def _handle(self, method: str):
+                started = time.monotonic()
+                url = urlparse(self.path)
+                raw = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+                if url.path.startswith('/_mock/'):
+                    self._control(method, url)
+                    return
+
+                table = url.path.rstrip('/').rsplit('/', 1)[-1]
+                entry = {'ts': round(time.time(), 3), 'method': method, 'table': table, 'status': 0,
+                         'rows_in': 0, 'rows_out': 0, 'bytes_in': len(raw), 'bytes_out': 0,
+                         'ms': 0.0, 'fault': None}
+                try:
+                    if not url.path.startswith('/rest/v1/') or not table or table == 'v1':
+                        entry['status'] = 404
+                        entry['bytes_out'] = self._reply(404, {'code': 'PGRST125', 'details': None, 'hint': None,
+                                                               'message': f'Invalid path {url.path}'})
+                        return
+                    self._serve(method, table, url, raw, entry)
+                finally:
+                    entry['ms'] = round((time.monotonic() - started) * 1000, 3)
+                    mock.metrics.record(entry)
+
+            def _serve(self, method: str, table: str, url, raw: bytes, entry: dict):
+                refused = mock.faults.admit()
+                if refused is not None:
+                    entry['fault'], status, retry_after = refused
+                    entry['status'] = status
+                    entry['bytes_out'] = self._reply(status, {
+                        'code': str(status), 'details': None, 'hint': None,
+                        'message': 'Too many requests' if status == 429 else 'Service unavailable',
+                    }, {'Retry-After': str(max(1, int(retry_after + 0.999)))})
+                    return
+
+                try:
+                    payload = json.loads(raw) if raw else None
+                except ValueError:
+                    payload = None
+                    entry['status'] = 400
+                    entry['bytes_out'] = self._reply(400, {'code': 'PGRST102', 'details': None, 'hint': None,
+                                                           'message': 'Empty or invalid json'})
+                    mock.faults.release()
+                    return
+                records = payload if isinstance(payload, list) else ([payload] if payload else [])
+                entry['rows_in'] = len(records) if method in ('POST', 'PATCH') else 0
+
+                try:
+                    fault = mock.faults.roll()
+                    mock.faults.delay(len(records))
+                    if fault == 'drop':
+                        entry['fault'] = 'dropped'
+                        self.close_connection = True
+                        return
+                    if fault == 'fail':
+                        entry['fault'] = 'failed'
+                        status = mock.faults.fail_status
+                        entry['status'] = status
+                        headers = {'Retry-After': '1'} if status == 503 else None
+                        entry['bytes_out'] = self._reply(status, {'code': str(status), 'details': None,
+                                                                  'hint': None, 'message': 'Injected failure'},
+                                                         headers)
+                        return
+
+                    rows, status, headers = self._apply(method, table, url, records, payload)
+                    if fault == 'lose':
+                        # Committed, but the client never hears of it, like a timeout after the commit
+                        entry['fault'] = 'lost'
+                        self.close_connection = True
+                        return
+                    entry['status'] = status
+                    entry['rows_out'] = len(rows) if rows is not None else 0
+                    entry['bytes_out'] = self._reply(status, rows, headers)
+                except PostgrestError as e:
+                    entry['status'] = e.status
+                    entry['bytes_out'] = self._reply(e.status, e.body())
+                finally:
+                    mock.faults.release()
+
+            def _apply(self, method: str, table: str, url, records: List[dict], payload):
+                params = parse_qsl(url.query, keep_blank_values=True)
+                query = dict(params)
+                prefer = {}
+                for item in ','.join(self.headers.get_all('Prefer') or []).split(','):
+                    name, _, value = item.strip().partition('=')
+                    if name:
+                        prefer[name] = value
+                representation = prefer.get('return') == 'representation'
+
+                if method == 'GET':
+                    rows, offset, total = mock.select(table, params, self.headers.get('Range'))
+                    count = str(total) if prefer.get('count') else '*'
+                    end = offset + len(rows) - 1
+                    content_range = f'{offset}-{end}/{count}' if rows else f'*/{count}'
+                    return rows, 200, {'Content-Range': content_range}
+
+                if method == 'POST':
+                    if not all(isinstance(record, dict) for record in records):
+                        raise PostgrestError(400, 'PGRST102', 'All object keys must match')
+                    columns = None
+                    if 'columns' in query:
+                        columns = [col.strip().strip('"') for col in query['columns'].split(',')]
+                    rows = mock.insert(table, records, prefer.get('resolution'), query.get('on_conflict'), columns)
+                    if 'select' in query:
+                        rows = [project(row, query['select']) for row in rows]
+                    return (rows if representation else None), 201, None
+
+                if method == 'PATCH':
+                    if not isinstance(payload, dict):
+                        raise PostgrestError(400, 'PGRST102', 'Empty or invalid json')
+                    rows = mock.update(table, params, payload)
+                else:
+                    rows = mock.delete(table, params)
+                if representation:
+                    return rows, 200, None
+                return None, 204, None
+
+            def _control(self, method: str, url):
+                if method == 'GET' and url.path == '/_mock/metrics':
+                    body = mock.metrics.summary()
+                    last = dict(parse_qsl(url.query)).get('last')
+                    if last:
+                        body['recent'] = list(mock.metrics.recent)[-int(last):]
+                    self._reply(200, body)
+                elif method == 'POST' and url.path == '/_mock/reset':
+                    mock.reset()
+                    self._reply(204)
+                elif method == 'GET' and url.path == '/_mock/tables':
+                    with mock.lock:
+                        self._reply(200, {name: len(t.rows) for name, t in mock.tables.items()})
+                else:
+                    self._reply(404, {'message': f'Unknown control endpoint {method} {url.path}'})
+
+        return Handler
+
+
+def load_schema(path: str) -> Dict[str, List[Tuple[str, ...]]]:
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return {table: [tuple(cols) for cols in keys] for table, keys in data.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve an in-memory PostgREST stand-in for offline imports")
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=54321, help='Port to listen on (default: %(default)s)')
+    parser.add_argument('--schema', default=None,
+                        help='JSON file of extra unique keys per table, e.g. {"products": [["sku"]]}')
+    parser.add_argument('--latency', type=float, default=0, help='Milliseconds added to every request')
+    parser.add_argument('--jitter', type=float, default=0, help='Up to this many random extra milliseconds')
+    parser.add_argument('--row-latency', type=float, default=0,
+                        help='Milliseconds added per row in a request body')
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help='Requests per second before answering 429 with Retry-After (default: unlimited)')
+    parser.add_argument('--burst', type=int, default=0, help='Requests allowed in a burst (default: the rate limit)')
+    parser.add_argument('--max-inflight', type=int, default=0,
+                        help='Concurrent requests before answering 503 with Retry-After (default: unlimited)')
+    parser.add_argument('--fail-rate', type=float, default=0, help='Fraction of requests answered with --fail-status')
+    parser.add_argument('--fail-status', type=int, default=503, help='Status of injected failures (default: %(default)s)')
+    parser.add_argument('--drop-rate', type=float, default=0,
+                        help='Fraction of requests whose connection is closed without a reply')
+    parser.add_argument('--lose-rate', type=float, default=0,
+                        help='Fraction of requests applied but then closed without a reply')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for injected jitter and failures')
+    parser.add_argument('--max-rows', type=int, default=0,
+                        help='Most rows returned by one GET, like db-max-rows (default: no cap)')
+    parser.add_argument('--metrics-file', default=None, help='Append every request as a JSON line to this file')
+    args = parser.parse_args()
+
+    faults = Faults(
+        latency_ms=args.latency, jitter_ms=args.jitter, row_latency_ms=args.row_latency,
+        rate_limit=args.rate_limit, burst=args.burst, max_inflight=args.max_inflight,
+        fail_rate=args.fail_rate, fail_status=args.fail_status, drop_rate=args.drop_rate,
+        lose_rate=args.lose_rate, seed=args.seed,
+    )
+    mock = MockPostgrest(args.host, args.port, load_schema(args.schema) if args.schema else None,
+                         faults, args.metrics_file, args.max_rows)
+    print(f"Mock PostgREST listening on {mock.url}/rest/v1/ (Ctrl-C to stop)", flush=True)
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    # kill stops the server like Ctrl-C, so the summary is still printed
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mock.server.server_close()
+        print("\nRequests served:")
+        for line in mock.metrics.summary_lines():
+            print(line)
+        mock.metrics.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+"""
+Rolloy SCM - Shared helpers for the Excel import scripts
+
+The standalone importers in scripts/ (import_data_rest.py, import_data_v2.py,
+import_excel_data.py, import_legacy_data.py) import from this package so that
+transport, parsing and bookkeeping code lives in one place.
+"""
@@ -0,0 +1,142 @@
+"""
+Rolloy SCM - On-disk cache of parsed workbook sheets
+
+Parsing a planning workbook with openpyxl dominates the start of every import
+run, and a re-run after fixing a database problem parses the same file again.
+SheetCache stores each sheet read with a column spec as an uncompressed Arrow
+IPC file, keyed by the SHA-256 of the workbook's content, the sheet name and
+the spec. A later run that finds the file memory-maps it instead of parsing.
+
+pyarrow is optional: without it SheetCache.available() is False and the
+import scripts read the workbook directly, as before.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+from typing import Dict, Iterator, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Bump when the on-disk layout or the cell normalisation changes
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'IMPORT_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'rolloy-scm', 'workbooks')
+)
+
+
+class SheetCache:
+    """Arrow IPC files of parsed sheets under cache_dir/<file sha256>/"""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._hashes = {}
+
+    @staticmethod
+    def available() -> bool:
+        return pa is not None
+
+    def file_hash(self, path: str) -> str:
+        """SHA-256 of the workbook's content, computed once per path"""
+        if path not in self._hashes:
+            self._hashes[path] = file_sha256(path)
+        return self._hashes[path]
+
+    def entry(self, path: str, sheet_name: str, columns: Dict[str, str]) -> str:
+        """Cache file for one sheet of one workbook read with one column spec"""
+        key = json.dumps([CACHE_VERSION, sheet_name, sorted(columns.items())], ensure_ascii=False)
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, self.file_hash(path), f'{name}.arrow')
+
+    def load(self, entry: str) -> Optional['pa.Table']:
+        """Memory-map a cached sheet, or None if it is not cached"""
+        if not os.path.exists(entry):
+            return None
+        try:
+            source = pa.memory_map(entry, 'r')
+            return pa.ipc.open_file(source).read_all()
+        except (OSError, pa.ArrowInvalid) as e:
+            print(f"  ! Ignoring unreadable cache file {entry}: {e}")
+            return None
+
+    def write(self, entry: str, frames: Iterator[pd.DataFrame],
+              columns: Dict[str, str]) -> Iterator[pd.DataFrame]:
+        """
+        Pass frames through while appending them to a new cache file
+
+        Frames must hold only NUMBER (float64) and text columns. The file is
+        written under a temporary name and only moved into place once every
+        frame has been consumed, so an interrupted run never leaves a partial
+        sheet behind.
+        """
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(entry), suffix='.tmp')
+        writer = None
+        complete = False
+        try:
+            with os.fdopen(fd, 'wb') as sink:
+                for df in frames:
+                    if writer is None:
+                        schema = arrow_schema(df.columns, columns)
+                        writer = pa.ipc.new_file(sink, schema)
+                    writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+                    yield df
+                if writer is not None:
+                    writer.close()
+            if writer is not None:
+                os.replace(tmp, entry)
+                complete = True
+        finally:
+            if not complete and os.path.exists(tmp):
+                os.remove(tmp)
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 hex digest of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def arrow_schema(names, columns: Dict[str, str]) -> 'pa.Schema':
+    """Arrow schema for the kept columns of a sheet: float64 for NUMBER, string otherwise"""
+    return pa.schema([
+        (name, pa.float64() if columns.get(name) == 'float64' else pa.string())
+        for name in names
+    ])
+
+
+def iter_frames(table: 'pa.Table', chunk_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """Yield a cached table as one frame, or as frames of at most chunk_size rows"""
+    if not chunk_size:
+        yield table_to_frame(table)
+        return
+    for batch in table.to_batches(max_chunksize=chunk_size):
+        yield table_to_frame(pa.Table.from_batches([batch], schema=table.schema))
+
+
+def table_to_frame(table: 'pa.Table') -> pd.DataFrame:
+    """Convert a cached table back to the frame the uncached read returns"""
+    df = table.to_pandas()
+    for field in table.schema:
+        if pa.types.is_string(field.type):
+            df[field.name] = df[field.name].astype(object)
+    return df
+
+
+def open_cache(cache_dir: str = DEFAULT_CACHE_DIR) -> Optional[SheetCache]:
+    """SheetCache for cache_dir, or None (with a note) when pyarrow is missing"""
+    if not SheetCache.available():
+        print("Sheet cache disabled: pyarrow is not installed")
+        return None
+    print(f"Sheet cache: {cache_dir}")
+    return SheetCache(cache_dir)
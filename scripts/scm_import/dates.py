@@ -0,0 +1,113 @@
+"""
+Rolloy SCM - Column-level date parsing and ISO week derivation
+
+Date cells in the planning workbook arrive as Excel dates (datetime64 after
+pandas reads them) or as text in one of a few formats. Instead of trying
+every format on every cell, parse_date_column() detects the format once per
+column, parses with pandas, and only falls back to a memoized per-value
+parser for the odd cell that does not match.
+"""
+
+from functools import lru_cache
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+DATE_FORMATS = ['%Y-%m-%d', '%Y/%m/%d', '%Y-%m-%d %H:%M:%S']
+WEEK_COLUMNS = ['week_iso', 'week_start_date', 'week_end_date']
+
+# Number of non-empty text cells inspected when sniffing a column's format
+SNIFF_SAMPLE = 50
+
+
+def sniff_date_format(values: Iterable[str]) -> Optional[str]:
+    """Return the first DATE_FORMATS entry that parses every sampled value"""
+    sample = [v.strip() for v in values][:SNIFF_SAMPLE]
+    if not sample:
+        return None
+    for fmt in DATE_FORMATS:
+        parsed = pd.to_datetime(pd.Series(sample), format=fmt, errors='coerce')
+        if parsed.notna().all():
+            return fmt
+    return None
+
+
+@lru_cache(maxsize=4096)
+def _parse_text(value: str) -> pd.Timestamp:
+    """Parse one text cell: known formats first, then pandas' own parser"""
+    text = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return pd.Timestamp(pd.to_datetime(text, format=fmt))
+        except (ValueError, TypeError):
+            pass
+    try:
+        return pd.Timestamp(text)
+    except (ValueError, TypeError):
+        return pd.NaT
+
+
+def parse_date_column(series: pd.Series) -> pd.Series:
+    """
+    Parse a column of dates to datetime64, NaT where a cell is empty or invalid
+
+    datetime64 columns pass straight through. Object columns are split into
+    date-like cells (converted in one call) and text cells; the text is parsed
+    with the sniffed format, and anything that format misses goes through the
+    memoized _parse_text().
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.dt.tz_localize(None) if series.dt.tz is not None else series
+
+    result = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    if series.empty:
+        return result
+
+    is_text = series.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+    is_empty = series.isna().to_numpy()
+
+    others = ~is_text & ~is_empty
+    if others.any():
+        result[others] = pd.to_datetime(series[others], errors='coerce')
+
+    if is_text.any():
+        text = series[is_text]
+        fmt = sniff_date_format(text)
+        parsed = (pd.to_datetime(text.str.strip(), format=fmt, errors='coerce')
+                  if fmt else pd.Series(pd.NaT, index=text.index))
+        missed = parsed.isna()
+        if missed.any():
+            parsed[missed] = [_parse_text(v) for v in text[missed]]
+        result[is_text] = parsed
+
+    return result
+
+
+def format_date_column(dates: pd.Series) -> pd.Series:
+    """Format a datetime64 column as YYYY-MM-DD strings, None where NaT"""
+    return dates.dt.strftime('%Y-%m-%d').astype(object).where(dates.notna(), None)
+
+
+def iso_week_columns(dates: pd.Series) -> pd.DataFrame:
+    """
+    Derive week_iso (YYYY-WXX), week_start_date (Monday) and week_end_date
+    (Sunday) for a datetime64 column, all as arrays
+    """
+    iso = dates.dt.isocalendar()
+    valid = dates.notna().to_numpy()
+
+    week_iso = np.full(len(dates), None, dtype=object)
+    if valid.any():
+        years = iso['year'].to_numpy()[valid].astype('int64').astype(str)
+        weeks = np.char.zfill(iso['week'].to_numpy()[valid].astype('int64').astype(str), 2)
+        week_iso[valid] = np.char.add(np.char.add(years, '-W'), weeks).astype(object)
+
+    week_start = dates.dt.normalize() - pd.to_timedelta(dates.dt.weekday, unit='D')
+    week_end = week_start + pd.Timedelta(days=6)
+
+    return pd.DataFrame({
+        'week_iso': week_iso,
+        'week_start_date': format_date_column(week_start),
+        'week_end_date': format_date_column(week_end),
+    }, index=dates.index)
@@ -0,0 +1,41 @@
+"""
+Rolloy SCM - Deterministic row ids derived from natural keys
+
+By default the import scripts let the database generate ids and read them
+back (return=representation) before writing child rows. With stable ids the
+id of every purchase order, PO item, delivery, shipment and shipment item is
+a UUIDv5 of its natural key instead, so a script knows all ids up front,
+writes with return=minimal, and a re-run upserts the same rows rather than
+creating new ones.
+"""
+
+import uuid
+from typing import Iterable, List
+
+# Fixed namespace for all Rolloy SCM ids; changing it changes every id
+NAMESPACE = uuid.uuid5(uuid.NAMESPACE_DNS, 'rolloy-scm.import')
+
+# Columns that identify a row of each table. Child keys use the parent's
+# (stable) id, so a child id is stable whenever its parent's is.
+NATURAL_KEYS = {
+    'purchase_orders': ('batch_code',),
+    'purchase_order_items': ('po_id', 'sku', 'channel_code'),
+    'production_deliveries': ('delivery_number',),
+    'shipments': ('tracking_number',),
+    'shipment_items': ('shipment_id', 'sku'),
+}
+
+
+def stable_id(table: str, *key) -> str:
+    """UUIDv5 string for the row of `table` with natural key `key`"""
+    name = '/'.join([table] + [str(part) for part in key])
+    return str(uuid.uuid5(NAMESPACE, name))
+
+
+def assign_ids(table: str, rows: Iterable[dict]) -> List[dict]:
+    """Set 'id' on each row from its natural key and return the rows"""
+    columns = NATURAL_KEYS[table]
+    rows = list(rows)
+    for row in rows:
+        row['id'] = stable_id(table, *(row[col] for col in columns))
+    return rows
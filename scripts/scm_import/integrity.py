@@ -0,0 +1,100 @@
+"""
+Rolloy SCM - Referential-integrity checks against a master-data snapshot
+
+A live import rejects forecast, actual and inventory rows whose SKU,
+channel or warehouse does not exist; a dry run never asked the database, so
+those errors only surfaced in the live run. MasterDataSnapshot holds the
+natural keys of products, channels and warehouses - loaded from a JSON file
+or fetched with one select per table - plus the keys the workbook's own
+master-data sheets will create. orphans() then checks every foreign key of
+every transactional sheet at once: one value_counts() per column and a set
+lookup of its distinct values, not a lookup per row.
+"""
+
+import os
+import json
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+SNAPSHOT_VERSION = 1
+
+# Master table -> its natural key
+SNAPSHOT_TABLES = {
+    'products': 'sku',
+    'channels': 'channel_code',
+    'warehouses': 'warehouse_code',
+}
+
+# Transactional table -> {column: master table it references}
+FOREIGN_KEYS = {
+    'sales_forecasts': {'sku': 'products', 'channel_code': 'channels'},
+    'sales_actuals': {'sku': 'products', 'channel_code': 'channels'},
+    'inventory_snapshots': {'sku': 'products', 'warehouse_code': 'warehouses'},
+}
+
+ORPHAN_COLUMNS = ['table', 'column', 'references', 'key', 'rows']
+
+
+class MasterDataSnapshot:
+    """Natural keys of the master tables, as a set per table"""
+
+    def __init__(self, keys: Optional[Dict[str, Iterable[str]]] = None, taken: Optional[str] = None):
+        self.keys = {table: set((keys or {}).get(table, ())) for table in SNAPSHOT_TABLES}
+        self.taken = taken or datetime.now().isoformat(timespec='seconds')
+
+    @classmethod
+    def fetch(cls, select: Callable[[str, List[str]], List[dict]]) -> 'MasterDataSnapshot':
+        """One select(table, columns) per master table"""
+        return cls({table: [row[key] for row in select(table, [key])]
+                    for table, key in SNAPSHOT_TABLES.items()})
+
+    @classmethod
+    def load(cls, path: str) -> 'MasterDataSnapshot':
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {data.get('version')} in {path}")
+        return cls(data['keys'], data.get('taken'))
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        data = {
+            'version': SNAPSHOT_VERSION,
+            'taken': self.taken,
+            'keys': {table: sorted(keys) for table, keys in self.keys.items()},
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    def add(self, table: str, values: Iterable[str]):
+        """Keys the import itself creates (e.g. the Products sheet's SKUs)"""
+        self.keys[table].update(value for value in pd.unique(pd.Series(values).dropna()))
+
+    def counts(self) -> str:
+        return ', '.join(f"{len(keys)} {table}" for table, keys in self.keys.items())
+
+    def orphans(self, frames: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+        """
+        Foreign keys of frames (table -> its rows) missing from the snapshot
+
+        One row per (table, column, key) with the number of rows using the
+        key, most rows first within each column.
+        """
+        found = []
+        for table, df in frames.items():
+            for column, references in FOREIGN_KEYS.get(table, {}).items():
+                if column not in df.columns:
+                    continue
+                counts = df[column].value_counts()
+                counts = counts[(counts > 0) & ~counts.index.isin(list(self.keys[references]))]
+                if counts.empty:
+                    continue
+                found.append(pd.DataFrame({
+                    'table': table, 'column': column, 'references': references,
+                    'key': counts.index.astype(object), 'rows': counts.to_numpy(),
+                }))
+        if not found:
+            return pd.DataFrame(columns=ORPHAN_COLUMNS)
+        return pd.concat(found, ignore_index=True)
@@ -0,0 +1,173 @@
+"""
+Rolloy SCM - Batch journal for resumable imports
+
+Every import run appends one JSON line to its journal for each batch it
+finishes: the stage (usually the table), a hash of the batch's records and
+what the rest of the run needs from the result, such as the ids of rows
+other tables reference. Each line is fsync'ed before the run moves on, so
+after a crash, a timeout or a killed process the journal lists exactly the
+batches that made it to the database.
+
+With --resume a script reopens the journal of the interrupted run, and
+Journal.run() hands back the recorded result of a finished batch instead of
+sending it again. The first line describes the run (workbook hash, target,
+options); a journal written for anything else is not resumed. A run that
+completes removes its journal.
+
+A batch that was sent but not yet recorded when the run died is sent again
+on resume, so long backfills should use idempotent writes (upserts,
+--stable-ids).
+"""
+
+import os
+import json
+import hashlib
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+JOURNAL_VERSION = 1
+
+DEFAULT_JOURNAL_DIR = os.environ.get(
+    'IMPORT_JOURNAL_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'rolloy-scm', 'journals')
+)
+
+# Rows per checkpoint of a bulk write; each checkpoint still goes out as
+# several concurrent array requests
+CHECKPOINT_ROWS = 5000
+
+
+def default_journal_path(script: str, target: str) -> str:
+    """Journal file for one import script writing to one target database"""
+    name = hashlib.sha1(target.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(DEFAULT_JOURNAL_DIR, f'{script}-{name}.jsonl')
+
+
+def batch_key(records: Iterable[dict]) -> str:
+    """Stable hash of a batch's records, identifying it across runs"""
+    text = json.dumps(list(records), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def checkpoints(rows: Iterable[dict], size: int = CHECKPOINT_ROWS) -> List[list]:
+    """Split rows into batches of at most size rows, one journal line each"""
+    rows = list(rows)
+    return [rows[i:i + size] for i in range(0, len(rows), size)]
+
+
+def keep_columns(result, keep: Optional[Sequence[str]] = None):
+    """result with each row cut down to the keep columns; anything but a list of rows as is"""
+    if keep is None or not isinstance(result, list):
+        return result
+    return [{col: row.get(col) for col in keep} for row in result]
+
+
+class Journal:
+    """Append-only JSONL record of the batches an import run has finished"""
+
+    def __init__(self):
+        # Disabled until open(): every batch is sent and nothing is written
+        self.path = None
+        self.enabled = False
+        # True when open() picked up an interrupted run's journal
+        self.resumed = False
+        self.skipped = 0
+        self._done = {}  # (stage, batch key) -> result, from the resumed run
+        self._file = None
+        self._lock = threading.Lock()
+
+    def open(self, path: str, run: Dict[str, object], resume: bool = False):
+        """
+        Start journaling to path a run described by run (workbook hash,
+        options, ...)
+
+        With resume the batches of a journal left by an interrupted run of
+        the same description are loaded and new lines are appended to it;
+        otherwise any old journal is replaced.
+        """
+        self.path = path
+        self.enabled = True
+        header = {'version': JOURNAL_VERSION, 'run': run}
+        if resume:
+            self._done = self._load(header)
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.resumed = bool(self._done)
+        if self.resumed:
+            print(f"Resuming from {self.path}: {len(self._done)} batches already finished")
+            self._file = open(self.path, 'a', encoding='utf-8')
+        else:
+            self._file = open(self.path, 'w', encoding='utf-8')
+            self._write(header)
+
+    def _load(self, header: dict) -> Dict[tuple, object]:
+        if not os.path.exists(self.path):
+            print(f"No journal to resume at {self.path}; starting from the beginning")
+            return {}
+
+        done = {}
+        with open(self.path, encoding='utf-8') as f:
+            first = f.readline()
+            try:
+                matches = json.loads(first) == json.loads(json.dumps(header, default=str))
+            except ValueError:
+                matches = False
+            if not matches:
+                print(f"  ! Journal {self.path} belongs to a different workbook or options; starting over")
+                return {}
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line torn by the crash; its batch is simply sent again
+                    continue
+                done[(entry['stage'], entry['batch'])] = entry['result']
+        return done
+
+    def _write(self, entry: dict):
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def run(self, stage: str, records: Sequence[dict], func: Callable[[], object],
+            keep: Optional[Sequence[str]] = None):
+        """
+        Return func()'s result for one batch of records
+
+        func is only called if the resumed run did not finish this batch;
+        otherwise the recorded result is returned. A None result means the
+        batch failed and is not recorded. keep names the columns of each
+        returned row to record (all of them when None); the same projection
+        is returned either way, also when the journal is disabled. Safe to
+        call from RestClient.map() workers.
+        """
+        if not self.enabled:
+            return keep_columns(func(), keep)
+
+        key = batch_key(records)
+        if (stage, key) in self._done:
+            with self._lock:
+                self.skipped += 1
+            return self._done[(stage, key)]
+
+        result = keep_columns(func(), keep)
+        if result is None:
+            return None
+        self._write({'stage': stage, 'batch': key, 'result': result})
+        return result
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def finish(self):
+        """The run completed: report what was skipped and remove the journal"""
+        if not self.enabled:
+            return
+        if self.skipped:
+            print(f"Resumed run skipped {self.skipped} batches finished before the interruption")
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
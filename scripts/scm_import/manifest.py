@@ -0,0 +1,207 @@
+"""
+Rolloy SCM - Row-fingerprint manifest for delta imports
+
+A delta import only sends rows that differ from the previous run. The
+manifest remembers, per table, a fingerprint of every row the last run left
+in the database, keyed by the row's natural key. On the next run each
+freshly built record is compared against it:
+
+    new        key not in the manifest          -> insert
+    changed    key present, fingerprint differs -> update
+    unchanged  same fingerprint                 -> skip
+    missing    in the manifest, not in the      -> delete
+               workbook now
+
+A row still in the workbook that could not be built because a lookup it
+needs failed is never deleted. Only rows confirmed as written (or deleted)
+change the manifest, so a row whose request failed is simply retried by the
+next run.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+from typing import Dict, Iterable, List, Optional, Sequence
+
+MANIFEST_VERSION = 1
+
+DEFAULT_MANIFEST_DIR = os.environ.get(
+    'IMPORT_MANIFEST_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'rolloy-scm', 'manifests')
+)
+
+
+def default_manifest_path(target: str) -> str:
+    """Manifest file for one target database (e.g. its Supabase URL)"""
+    name = hashlib.sha1(target.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(DEFAULT_MANIFEST_DIR, f'{name}.json')
+
+
+def fingerprint(record: dict) -> str:
+    """Stable hash of a record's normalized JSON form"""
+    text = json.dumps(record, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class TableDelta:
+    """Compares one table's records for this run against the previous run"""
+
+    def __init__(self, name: str, key_cols: Sequence[str],
+                 previous: Optional[Dict[str, str]] = None, enabled: bool = True):
+        self.name = name
+        self.key_cols = tuple(key_cols)
+        self.enabled = enabled
+        self._previous = previous or {}
+        self._current = {}   # key -> fingerprint now in the database
+        self._pending = {}   # key -> fingerprint being written this run
+        self._removed = set()
+        self._kept = set()   # keys still in the workbook whose rows could not be built
+        self.held = None     # why nothing may be deleted this run, if so
+        self.counts = {'new': 0, 'changed': 0, 'unchanged': 0, 'deleted': 0}
+
+    def _key(self, record: dict) -> str:
+        return json.dumps([record[col] for col in self.key_cols], ensure_ascii=False, default=str)
+
+    def key_of(self, record: dict) -> Dict[str, object]:
+        """The natural key columns of a record, for eq() filters"""
+        return {col: record[col] for col in self.key_cols}
+
+    def changes(self, records: Iterable[dict], replace: bool = False) -> List[dict]:
+        """
+        The records that have to be written: new and changed ones
+
+        When disabled every record is returned unchanged. Otherwise a record
+        repeating a key already seen in this run is dropped, so the first one
+        wins as it would for inserts. With replace (upserts) the last record
+        of each key wins, and one that differs from an earlier call's is
+        returned again.
+        """
+        records = list(records)
+        if not self.enabled:
+            return records
+        if replace:
+            # Only the last record of each key would be left in the table
+            records = list({self._key(record): record for record in records}.values())
+
+        out = []
+        for record in records:
+            key = self._key(record)
+            fp = fingerprint(record)
+            seen = self._pending.get(key, self._current.get(key))
+            if seen is not None:
+                if replace and fp != seen:
+                    self._current.pop(key, None)
+                    self._pending[key] = fp
+                    out.append(record)
+                continue
+            if self._previous.get(key) == fp:
+                self._current[key] = fp
+                self.counts['unchanged'] += 1
+            else:
+                self._pending[key] = fp
+                self.counts['changed' if key in self._previous else 'new'] += 1
+                out.append(record)
+        return out
+
+    def is_new(self, record: dict) -> bool:
+        """True if the previous run never wrote this record's key"""
+        return not self.enabled or self._key(record) not in self._previous
+
+    def confirm(self, records: Iterable[dict]):
+        """Mark records (as sent, or as returned by the database) as written"""
+        if not self.enabled:
+            return
+        for record in records:
+            key = self._key(record)
+            if key in self._pending:
+                self._current[key] = self._pending.pop(key)
+
+    def keep(self, records: Iterable[dict]):
+        """
+        Records the workbook still has but this run could not build (a
+        lookup they need failed): their keys are not missing, and their old
+        state is remembered so the next run tries them again
+        """
+        if not self.enabled:
+            return
+        for record in records:
+            self._kept.add(self._key(record))
+
+    def hold(self, reason: str):
+        """
+        Some workbook rows could not even be given a key (it contains an id
+        that a failed lookup should have supplied), so no key can be told
+        missing: nothing is deleted from this table in this run
+        """
+        if self.enabled and self.held is None:
+            self.held = reason
+
+    def missing(self) -> List[Dict[str, object]]:
+        """Natural keys the previous run wrote that are gone from the workbook"""
+        if not self.enabled or self.held is not None:
+            return []
+        seen = set(self._current) | set(self._pending) | self._removed | self._kept
+        return [dict(zip(self.key_cols, json.loads(key)))
+                for key in self._previous if key not in seen]
+
+    def removed(self, key: Dict[str, object]):
+        """Mark a missing key as deleted from the database"""
+        self._removed.add(self._key(key))
+        self.counts['deleted'] += 1
+
+    def snapshot(self) -> Dict[str, str]:
+        """Fingerprints to remember: this run's writes plus anything unresolved"""
+        result = dict(self._current)
+        for key, fp in self._previous.items():
+            if key not in result and key not in self._removed:
+                # Failed update or delete: keep the old state so it is retried
+                result[key] = fp
+        return result
+
+
+class Manifest:
+    """Per-table TableDeltas backed by one JSON file"""
+
+    def __init__(self, path: Optional[str] = None):
+        # Without a path the manifest is disabled and every row is sent
+        self.path = path
+        self.enabled = path is not None
+        self._previous = {}
+        self._tables = {}
+        if self.enabled and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self._previous = data.get('tables', {})
+            else:
+                print(f"  ! Ignoring manifest {path}: unknown version")
+
+    def table(self, name: str, key_cols: Sequence[str]) -> TableDelta:
+        if name not in self._tables:
+            self._tables[name] = TableDelta(
+                name, key_cols, self._previous.get(name), enabled=self.enabled
+            )
+        return self._tables[name]
+
+    def summary(self) -> List[str]:
+        lines = []
+        for name, delta in self._tables.items():
+            c = delta.counts
+            lines.append(f"  - {name}: {c['new']} new, {c['changed']} changed, "
+                         f"{c['unchanged']} unchanged, {c['deleted']} deleted")
+        return lines
+
+    def save(self):
+        """Write the manifest atomically; tables this run never touched are kept"""
+        if not self.enabled:
+            return
+        tables = dict(self._previous)
+        for name, delta in self._tables.items():
+            tables[name] = delta.snapshot()
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'tables': tables}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
@@ -0,0 +1,283 @@
+"""
+Rolloy SCM - Run instrumentation and machine-readable run report
+
+RunMetrics collects what one import run did. Per stage: wall time, rows
+read from the workbook, rows transformed into records, rows sent and rows
+that failed, requests, bytes sent and received, retries and failed
+requests. Per sheet: rows read and parse time. Per table and HTTP method:
+every call's count, time, bytes and status.
+
+Stages are attributed through a context variable. Pipeline enters
+metrics.stage() around each stage, and RestClient.map() carries the
+caller's context into its workers, so a call made on any thread is charged
+to the stage that made it. RestClient and WorkbookReader take the run's
+RunMetrics; supabase-py clients are wrapped with instrument_supabase().
+
+finish() writes the report as JSON (by default one file per run under
+$IMPORT_REPORT_DIR) and prints a summary, so the slowest sheet or table of
+a production run can be read off afterwards.
+"""
+
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+REPORT_VERSION = 1
+
+DEFAULT_REPORT_DIR = os.environ.get(
+    'IMPORT_REPORT_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'rolloy-scm', 'reports')
+)
+
+# Counters kept per stage
+STAGE_COUNTERS = (
+    'rows_read', 'rows_transformed', 'rows_sent', 'rows_failed',
+    'requests', 'bytes_sent', 'bytes_received', 'retries', 'failures',
+)
+
+# Charged with whatever happens outside a stage (connection checks, lookups in main())
+NO_STAGE = '(run)'
+
+_current_stage = contextvars.ContextVar('import_stage', default=NO_STAGE)
+
+
+def default_report_path(script: str) -> str:
+    """Report file for one run of an import script"""
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    return os.path.join(DEFAULT_REPORT_DIR, f'{script}-{stamp}.json')
+
+
+def body_rows(body) -> int:
+    """Rows in a JSON request body: the length of an array, 1 for an object"""
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, str)):
+        if not body:
+            return 0
+        try:
+            body = json.loads(body)
+        except ValueError:
+            return 0
+    if isinstance(body, list):
+        return len(body)
+    return 1 if isinstance(body, dict) else 0
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class RunMetrics:
+    """Thread-safe counters and timings of one import run"""
+
+    def __init__(self, script: str):
+        self.script = script
+        self.started = time.time()
+        self.finished = None
+        self.stages: Dict[str, dict] = {}
+        self.sheets: Dict[str, dict] = {}
+        self.http: Dict[tuple, dict] = {}  # (method, table) -> totals
+        self._lock = threading.Lock()
+
+    def _stage(self, name: str) -> dict:
+        # Callers hold the lock
+        if name not in self.stages:
+            self.stages[name] = dict.fromkeys(STAGE_COUNTERS, 0)
+            self.stages[name].update(seconds=0.0, status='running' if name != NO_STAGE else 'ok')
+        return self.stages[name]
+
+    @contextmanager
+    def stage(self, name: str):
+        """Charge everything done inside the block, on any thread it spawns via map(), to name"""
+        with self._lock:
+            self._stage(name)
+        token = _current_stage.set(name)
+        started = time.monotonic()
+        status = 'failed'
+        try:
+            yield
+            status = 'ok'
+        finally:
+            _current_stage.reset(token)
+            with self._lock:
+                record = self._stage(name)
+                record['seconds'] += time.monotonic() - started
+                record['status'] = status
+
+    def count(self, field: str, n: int = 1):
+        """Add n to one of STAGE_COUNTERS of the current stage"""
+        with self._lock:
+            self._stage(_current_stage.get())[field] += n
+
+    def sheet_read(self, sheet: str, rows: int, seconds: float):
+        """A sheet (or one chunk of it) was read"""
+        with self._lock:
+            record = self.sheets.setdefault(sheet, {'rows': 0, 'seconds': 0.0, 'chunks': 0})
+            record['rows'] += rows
+            record['seconds'] += seconds
+            record['chunks'] += 1
+            self._stage(_current_stage.get())['rows_read'] += rows
+
+    def request(self, method: str, table: str, status: int, seconds: float,
+                bytes_sent: int = 0, bytes_received: int = 0, rows: int = 0):
+        """
+        One HTTP call (or COPY); status 0 means no response (timeout, refused, reset)
+
+        rows is the number of rows in the request body; they count as sent
+        when the call succeeded and as failed otherwise.
+        """
+        failed = status == 0 or status >= 400
+        with self._lock:
+            record = self.http.setdefault((method, table), {
+                'requests': 0, 'rows': 0, 'bytes_sent': 0, 'bytes_received': 0,
+                'retries': 0, 'failures': 0, 'seconds': 0.0, 'status': {}, 'ms': [],
+            })
+            record['requests'] += 1
+            record['bytes_sent'] += bytes_sent
+            record['bytes_received'] += bytes_received
+            record['seconds'] += seconds
+            record['ms'].append(seconds * 1000)
+            record['status'][str(status)] = record['status'].get(str(status), 0) + 1
+            if failed:
+                record['failures'] += 1
+            else:
+                record['rows'] += rows
+
+            stage = self._stage(_current_stage.get())
+            stage['requests'] += 1
+            stage['bytes_sent'] += bytes_sent
+            stage['bytes_received'] += bytes_received
+            if failed:
+                stage['failures'] += 1
+            elif method in ('POST', 'PATCH', 'PUT', 'COPY'):
+                stage['rows_sent'] += rows
+
+    def retry(self, method: str, table: str, n: int = 1):
+        """n requests to table are being sent again"""
+        with self._lock:
+            record = self.http.get((method, table))
+            if record is not None:
+                record['retries'] += n
+            self._stage(_current_stage.get())['retries'] += n
+
+    def report(self) -> dict:
+        """The run as a JSON-serialisable dict"""
+        with self._lock:
+            finished = self.finished or time.time()
+            stages = {name: dict(record, seconds=round(record['seconds'], 4))
+                      for name, record in self.stages.items()}
+            sheets = {name: dict(record, seconds=round(record['seconds'], 4))
+                      for name, record in self.sheets.items()}
+            http = []
+            for (method, table), record in self.http.items():
+                ms = record['ms']
+                http.append(dict(
+                    {k: v for k, v in record.items() if k != 'ms'},
+                    method=method, table=table, seconds=round(record['seconds'], 4),
+                    ms_p50=round(percentile(ms, 0.50), 2), ms_p95=round(percentile(ms, 0.95), 2),
+                    ms_max=round(max(ms, default=0.0), 2),
+                ))
+        http.sort(key=lambda record: -record['seconds'])
+
+        totals = {field: sum(record[field] for record in stages.values()) for field in STAGE_COUNTERS}
+        return {
+            'version': REPORT_VERSION,
+            'script': self.script,
+            'started': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'finished': datetime.fromtimestamp(finished).isoformat(timespec='seconds'),
+            'seconds': round(finished - self.started, 4),
+            'totals': totals,
+            'stages': stages,
+            'sheets': sheets,
+            'http': http,
+        }
+
+    def summary_lines(self, report: Optional[dict] = None) -> List[str]:
+        report = report or self.report()
+        mb = 1024 * 1024
+        lines = [f"Run took {report['seconds']:.2f}s"]
+
+        width = max((len(name) for name in report['stages']), default=0)
+        lines.append(f"  {'stage':<{width}}  {'seconds':>8}  {'read':>7}  {'built':>7}  {'sent':>7}  "
+                     f"{'failed':>6}  {'requests':>8}  {'MB out':>7}  {'MB in':>7}  {'retries':>7}")
+        for name, s in report['stages'].items():
+            status = '' if s['status'] == 'ok' else f"  ({s['status']})"
+            lines.append(f"  {name:<{width}}  {s['seconds']:>8.2f}  {s['rows_read']:>7}  "
+                         f"{s['rows_transformed']:>7}  {s['rows_sent']:>7}  {s['rows_failed']:>6}  "
+                         f"{s['requests']:>8}  {s['bytes_sent'] / mb:>7.2f}  {s['bytes_received'] / mb:>7.2f}  "
+                         f"{s['retries']:>7}{status}")
+
+        if report['sheets']:
+            lines.append("Sheets (slowest first):")
+            for name, s in sorted(report['sheets'].items(), key=lambda item: -item[1]['seconds']):
+                lines.append(f"  - {name}: {s['rows']} rows in {s['seconds']:.2f}s")
+
+        if report['http']:
+            lines.append("HTTP by table (most time first):")
+            for h in report['http'][:10]:
+                failures = f", {h['failures']} failed" if h['failures'] else ''
+                retries = f", {h['retries']} retried" if h['retries'] else ''
+                lines.append(f"  - {h['method']} {h['table']}: {h['requests']} requests, {h['rows']} rows, "
+                             f"{h['seconds']:.2f}s (p50 {h['ms_p50']:.0f}ms, p95 {h['ms_p95']:.0f}ms)"
+                             f"{failures}{retries}")
+        return lines
+
+    def write(self, path: str, report: Optional[dict] = None):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report or self.report(), f, ensure_ascii=False, indent=2)
+
+    def finish(self, path: Optional[str]):
+        """Stop the clock, write the JSON report to path (if any) and print the summary"""
+        self.finished = time.time()
+        report = self.report()
+        print("\nRun metrics:")
+        for line in self.summary_lines(report):
+            print(line)
+        if path:
+            try:
+                self.write(path, report)
+                print(f"Run report written to {path}")
+            except OSError as e:
+                print(f"  ! Could not write run report {path}: {e}")
+
+
+def table_of(path: str) -> str:
+    """Table name of a /rest/v1/<table> path"""
+    return path.rstrip('/').rsplit('/', 1)[-1]
+
+
+def instrument_httpx(session, metrics: RunMetrics):
+    """Record every request an httpx.Client sends"""
+    def timed_send(request, *args, **kwargs):
+        started = time.monotonic()
+        content = request.content
+        try:
+            # Resolved per call, so patches of the class made later still apply
+            response = type(session).send(session, request, *args, **kwargs)
+        except Exception:
+            metrics.request(request.method, table_of(request.url.path), 0, time.monotonic() - started,
+                            len(content), 0, body_rows(content))
+            raise
+        metrics.request(request.method, table_of(request.url.path), response.status_code,
+                        time.monotonic() - started, len(content), len(response.content), body_rows(content))
+        return response
+
+    session.send = timed_send
+
+
+def instrument_supabase(client, metrics: RunMetrics):
+    """Record every PostgREST call of a supabase-py client"""
+    postgrest = getattr(client, 'postgrest', None)
+    session = getattr(postgrest, 'session', None)
+    if session is None:
+        print("  ! HTTP metrics unavailable for this supabase client version")
+        return
+    instrument_httpx(session, metrics)
@@ -0,0 +1,314 @@
+"""
+Rolloy SCM - Offline 12-week inventory projection
+
+The app reads its projection from the v_inventory_projection_12weeks
+materialized view, rebuilt by SELECT refresh_inventory_projections(). The
+same numbers are computed here from plain frames - the rows the importers
+build or fetch - so a projection can be previewed before the refresh, or
+the refreshed view checked against it.
+
+Every quantity is a 2-D float array of SKUs x weeks. Sales and arrivals
+are scattered into the grid with one np.bincount() each, and closing stock
+is a cumulative sum along the week axis, so thousands of SKUs take
+milliseconds:
+
+    effective_sales = actual if the week has a non-zero actual, else forecast
+    closing[w]      = current stock + sum of (incoming - effective_sales) up to w
+    opening[w]      = closing[w - 1], current stock in week 0
+    status          = Stockout if closing < 0, Risk if closing < safety
+                      threshold (average effective sales x safety_stock_weeks),
+                      else OK
+
+project() follows the view's SQL to the letter, including its edges: only
+forecasts whose week starts today or later (up to 12 weeks on) count, an
+actual counts only where a forecast of the same SKU, channel and week
+exists, and arrivals are counted from today up to 12 weeks on.
+"""
+
+from datetime import date, timedelta
+from typing import Dict, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+PROJECTION_WEEKS = 12
+
+# stock_status codes of InventoryProjection.status
+STOCK_STATUS = np.array(['OK', 'Risk', 'Stockout'])
+OK, RISK, STOCKOUT = 0, 1, 2
+
+# Columns of v_inventory_projection_12weeks that to_frame() produces, in the view's order
+PROJECTION_COLUMNS = [
+    'sku', 'week_iso', 'week_start_date', 'week_end_date', 'week_offset', 'opening_stock',
+    'incoming_qty', 'effective_sales', 'forecast_qty', 'actual_qty', 'closing_stock',
+    'safety_stock_threshold', 'stock_status', 'weeks_until_stockout',
+]
+
+# Columns compare() checks
+CHECK_COLUMNS = [
+    'opening_stock', 'incoming_qty', 'effective_sales', 'forecast_qty', 'actual_qty',
+    'closing_stock', 'safety_stock_threshold', 'stock_status', 'weeks_until_stockout',
+]
+
+MISMATCH_COLUMNS = ['sku', 'week_iso', 'column', 'expected', 'found']
+
+
+def iso_week(day: date) -> str:
+    """'2025-W07', as the database's get_week_iso()"""
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def _dates(values: pd.Series) -> np.ndarray:
+    """Dates (strings, Timestamps or dates) as datetime64[D]; NaT where missing or unparsable"""
+    return pd.to_datetime(values, errors='coerce').to_numpy(dtype='datetime64[D]')
+
+
+def _numbers(values: pd.Series) -> np.ndarray:
+    return pd.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+
+
+def _round_half_up(values: np.ndarray) -> np.ndarray:
+    # PostgreSQL rounds numeric halves away from zero; np.round() rounds them to even
+    return np.sign(values) * np.floor(np.abs(values) + 0.5)
+
+
+def _divide_half_up(numerator: int, denominator: int) -> int:
+    quotient, remainder = divmod(abs(numerator), denominator)
+    quotient += 2 * remainder >= denominator
+    return quotient if numerator >= 0 else -quotient
+
+
+def _avg_scale(total: int, count: int) -> int:
+    """Decimal places PostgreSQL keeps of AVG() = total / count (numeric select_div_scale())"""
+    def weight(value):
+        # Position and value of the leading base-10000 digit
+        if value == 0:
+            return 0, 0
+        w = (len(str(abs(value))) - 1) // 4
+        return w, abs(value) // 10000 ** w
+    total_weight, total_digit = weight(total)
+    count_weight, count_digit = weight(count)
+    quotient_weight = total_weight - count_weight - (total_digit <= count_digit)
+    return min(max(16 - 4 * quotient_weight, 0), 1000)
+
+
+def _safety_threshold(total: np.ndarray, count: np.ndarray, safety_weeks: np.ndarray) -> np.ndarray:
+    """
+    ROUND(AVG(weekly sales) * safety_stock_weeks) from each SKU's sales total and week count
+
+    Rounding the exact ratio is right except when it ends in exactly .5:
+    the database rounds the average to a limited number of decimals first,
+    which can pull it below the half. Those few SKUs are redone in integers
+    the way PostgreSQL does it.
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average = np.where(count > 0, total / np.maximum(count, 1), 0.0)
+        threshold = _round_half_up(average * safety_weeks)
+        tie = (count > 0) & ((2 * total * safety_weeks) % (2 * count) == count) \
+            & (total == np.round(total)) & (safety_weeks == np.round(safety_weeks))
+    for i in np.flatnonzero(tie):
+        sku_total, sku_count, weeks = int(total[i]), int(count[i]), int(safety_weeks[i])
+        scale = _avg_scale(sku_total, sku_count)
+        rounded_average = _divide_half_up(sku_total * 10 ** scale, sku_count)
+        threshold[i] = _divide_half_up(rounded_average * weeks, 10 ** scale)
+    return threshold
+
+
+def shipment_lines(shipments: pd.DataFrame, items: pd.DataFrame) -> pd.DataFrame:
+    """Shipment items with their shipment's planned and actual arrival dates, as project() takes them"""
+    arrivals = shipments[['id', 'planned_arrival_date', 'actual_arrival_date']]
+    return items[['shipment_id', 'sku', 'shipped_qty']].merge(
+        arrivals, left_on='shipment_id', right_on='id', how='inner'
+    )
+
+
+class InventoryProjection:
+    """The projection of every SKU over the weeks, as SKUs x weeks arrays"""
+
+    def __init__(self, skus: np.ndarray, today: date, weeks: int):
+        self.skus = skus
+        self.today = today
+        self.week_starts = np.datetime64(today - timedelta(days=today.weekday()), 'D') + 7 * np.arange(weeks)
+        self.week_isos = [iso_week(today + timedelta(weeks=n)) for n in range(weeks)]
+        shape = (len(skus), weeks)
+        self.current_stock = np.zeros(len(skus))
+        self.safety_threshold = np.full(len(skus), np.nan)
+        self.incoming = np.zeros(shape)
+        self.forecast = np.zeros(shape)
+        self.actual = np.zeros(shape)
+        self.effective = np.zeros(shape)
+        self.opening = np.zeros(shape)
+        self.closing = np.zeros(shape)
+        self.status = np.zeros(shape, dtype=np.int8)
+        self.weeks_until_stockout = np.full(shape, np.nan)
+
+    def stock_status(self) -> np.ndarray:
+        """status as 'OK' / 'Risk' / 'Stockout' labels"""
+        return STOCK_STATUS[self.status]
+
+    def counts(self) -> Dict[str, int]:
+        """SKUs per worst status over the weeks"""
+        worst = self.status.max(axis=1, initial=OK)
+        return {label: int((worst == code).sum()) for code, label in enumerate(STOCK_STATUS.tolist())}
+
+    def first_risk_week(self) -> np.ndarray:
+        """Week offset of each SKU's first Risk or Stockout week, -1 if it has none"""
+        at_risk = self.status > OK
+        return np.where(at_risk.any(axis=1), at_risk.argmax(axis=1), -1)
+
+    def to_frame(self) -> pd.DataFrame:
+        """One row per SKU and week, with the view's columns, ordered by sku and week"""
+        n, weeks = self.closing.shape
+        starts = np.tile(self.week_starts, n)
+        return pd.DataFrame({
+            'sku': np.repeat(self.skus, weeks),
+            'week_iso': np.tile(np.array(self.week_isos, dtype=object), n),
+            'week_start_date': starts,
+            'week_end_date': starts + 6,
+            'week_offset': np.tile(np.arange(weeks), n),
+            'opening_stock': self.opening.ravel(),
+            'incoming_qty': self.incoming.ravel(),
+            'effective_sales': self.effective.ravel(),
+            'forecast_qty': self.forecast.ravel(),
+            'actual_qty': self.actual.ravel(),
+            'closing_stock': self.closing.ravel(),
+            'safety_stock_threshold': np.repeat(self.safety_threshold, weeks),
+            'stock_status': self.stock_status().ravel(),
+            'weeks_until_stockout': self.weeks_until_stockout.ravel(),
+        })[PROJECTION_COLUMNS]
+
+    def compare(self, view: pd.DataFrame, tolerance: float = 1e-6) -> pd.DataFrame:
+        """
+        Cells of view (rows of v_inventory_projection_12weeks) that differ from this projection
+
+        One row of MISMATCH_COLUMNS per differing (sku, week, column); a SKU
+        and week found on only one side is reported once with column '(row)'
+        and 'row' as expected (projected only) or found (in the view only).
+        Numbers match within tolerance, and two missing values match.
+        """
+        ours = self.to_frame()
+        keys = ['sku', 'week_iso']
+        # An empty view read back without columns still has no rows to match
+        view = view.reindex(columns=keys + [c for c in view.columns if c not in keys])
+        view[keys] = view[keys].astype(object)
+        merged = ours.merge(view, on=keys, how='outer', suffixes=('', '_found'), indicator=True)
+        found = []
+        one_sided = merged['_merge'] != 'both'
+        if one_sided.any():
+            side = merged.loc[one_sided, '_merge']
+            found.append(pd.DataFrame({
+                'sku': merged.loc[one_sided, 'sku'], 'week_iso': merged.loc[one_sided, 'week_iso'],
+                'column': '(row)',
+                'expected': np.where(side == 'left_only', 'row', None),
+                'found': np.where(side == 'right_only', 'row', None),
+            }))
+
+        both = merged[~one_sided]
+        for column in CHECK_COLUMNS:
+            if f'{column}_found' not in both.columns:
+                continue
+            expected, actual = both[column], both[f'{column}_found']
+            if column == 'stock_status':
+                differs = expected.to_numpy() != actual.to_numpy()
+            else:
+                a, b = _numbers(expected), _numbers(actual)
+                differs = ~((np.isnan(a) & np.isnan(b)) | (np.abs(a - b) <= tolerance))
+            if differs.any():
+                found.append(pd.DataFrame({
+                    'sku': both['sku'][differs], 'week_iso': both['week_iso'][differs], 'column': column,
+                    'expected': expected[differs].astype(object), 'found': actual[differs].astype(object),
+                }))
+        if not found:
+            return pd.DataFrame(columns=MISMATCH_COLUMNS)
+        return pd.concat(found, ignore_index=True).sort_values(['sku', 'week_iso'], kind='stable')
+
+
+def project(products: pd.DataFrame, forecasts: pd.DataFrame, actuals: pd.DataFrame,
+            shipments: pd.DataFrame, inventory: pd.DataFrame,
+            today: Optional[Union[date, str]] = None, weeks: int = PROJECTION_WEEKS) -> InventoryProjection:
+    """
+    Project the stock of every active product over weeks weeks from today
+
+    Frames hold the columns of the database tables:
+      products   sku, safety_stock_weeks, is_active (optional; every row
+                 counts when absent)
+      forecasts  sku, channel_code, week_iso, week_start_date, forecast_qty
+      actuals    sku, channel_code, week_iso, actual_qty
+      shipments  sku, shipped_qty, planned_arrival_date, actual_arrival_date
+                 (one row per shipment item, see shipment_lines())
+      inventory  sku, qty_on_hand
+    """
+    today = pd.Timestamp(today or date.today()).date()
+    horizon = np.datetime64(today + timedelta(weeks=PROJECTION_WEEKS), 'D')
+    start = np.datetime64(today, 'D')
+
+    if 'is_active' in products.columns:
+        products = products[products['is_active'].fillna(False).astype(bool)]
+    skus = pd.Index(products['sku'].to_numpy(dtype=object))
+    result = InventoryProjection(skus.to_numpy(), today, weeks)
+    n = len(skus)
+    week_index = pd.Index(result.week_isos)
+
+    def grid(rows, cols, values) -> np.ndarray:
+        """values summed into an n x weeks array at (rows, cols); negative indexes are dropped"""
+        keep = (rows >= 0) & (cols >= 0) & ~np.isnan(values)
+        flat = rows[keep] * weeks + cols[keep]
+        counted = np.bincount(flat, weights=values[keep], minlength=n * weeks)
+        return counted.astype(float, copy=False).reshape(n, weeks)
+
+    # Current stock: every warehouse's snapshot of the SKU
+    on_hand = inventory.groupby('sku', sort=False)['qty_on_hand'].sum(min_count=1)
+    current = on_hand.reindex(skus).to_numpy(dtype=float)
+    result.current_stock = np.nan_to_num(current)
+
+    # Incoming: shipped quantity by the week of the actual, else planned, arrival
+    arrival = _dates(shipments['actual_arrival_date'])
+    planned = _dates(shipments['planned_arrival_date'])
+    arrival = np.where(np.isnat(arrival), planned, arrival)
+    arriving = (arrival >= start) & (arrival <= horizon)
+    week0 = result.week_starts[0]
+    cols = np.where(arriving, (arrival - week0).astype('timedelta64[D]').astype(np.int64) // 7, -1)
+    cols[cols >= weeks] = -1
+    result.incoming = grid(skus.get_indexer(shipments['sku']), cols, _numbers(shipments['shipped_qty']))
+
+    # Effective sales per SKU and week: each forecast with the actual of its channel
+    week_start = _dates(forecasts['week_start_date'])
+    in_range = forecasts[(week_start >= start) & (week_start <= horizon)]
+    sales = in_range[['sku', 'channel_code', 'week_iso', 'forecast_qty']].merge(
+        actuals[['sku', 'channel_code', 'week_iso', 'actual_qty']],
+        on=['sku', 'channel_code', 'week_iso'], how='left',
+    )
+    sales['forecast_qty'] = pd.to_numeric(sales['forecast_qty'], errors='coerce')
+    sales['actual_qty'] = pd.to_numeric(sales['actual_qty'], errors='coerce')
+    weekly = sales.groupby(['sku', 'week_iso'], sort=False)[['forecast_qty', 'actual_qty']].sum(min_count=1)
+    forecast_sum = weekly['forecast_qty'].to_numpy(dtype=float)
+    actual_sum = weekly['actual_qty'].to_numpy(dtype=float)
+    # A week whose actuals sum to zero falls back to its forecast, as NULLIF(.., 0) does
+    effective = np.where(np.isnan(actual_sum) | (actual_sum == 0), forecast_sum, actual_sum)
+
+    rows = skus.get_indexer(weekly.index.get_level_values('sku'))
+    cols = week_index.get_indexer(weekly.index.get_level_values('week_iso'))
+    result.forecast = grid(rows, cols, forecast_sum)
+    result.actual = grid(rows, cols, actual_sum)
+    result.effective = grid(rows, cols, effective)
+
+    # Average over every in-range week with sales, including one past the grid
+    weeks_sold = pd.Series(effective).groupby(rows).agg(['sum', 'count']).reindex(np.arange(n), fill_value=0)
+    result.safety_threshold = _safety_threshold(
+        weeks_sold['sum'].to_numpy(dtype=float), weeks_sold['count'].to_numpy(dtype=float),
+        _numbers(products['safety_stock_weeks']),
+    )
+
+    result.closing = result.current_stock[:, None] + np.cumsum(result.incoming - result.effective, axis=1)
+    result.opening = np.concatenate([result.current_stock[:, None], result.closing[:, :-1]], axis=1)
+
+    threshold = result.safety_threshold[:, None]
+    with np.errstate(invalid='ignore'):
+        result.status = np.where(result.closing < 0, STOCKOUT,
+                                 np.where(result.closing < threshold, RISK, OK)).astype(np.int8)
+    selling = (result.closing > 0) & (result.effective > 0)
+    result.weeks_until_stockout = np.floor(np.divide(
+        result.closing, result.effective, out=np.full_like(result.closing, np.nan), where=selling
+    ))
+    return result
@@ -0,0 +1,215 @@
+"""
+Rolloy SCM - Cached natural-key -> id maps of the reference tables
+
+Every stage that writes rows referencing products, channels, warehouses or
+suppliers used to read that whole table for itself, and every run read them
+all again. ReferenceData keeps one map per table for the whole run, shared
+by all stages, and remembers it on disk per target database, so the next
+run of any import script starts from it.
+
+Before a stored map is used, one request per table asks for its row count
+and its largest updated_at:
+
+    same count, same updated_at     -> the stored map is used as is
+    newer updated_at                -> only rows updated since are read
+    anything else (rows deleted, no updated_at column, no stored map)
+                                    -> the table is read in full
+
+A map that does not come out with exactly count entries is read in full
+too. A stage that creates rows in a reference table calls invalidate(), so
+the next lookup in the run checks the table again and picks them up.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+REFDATA_VERSION = 1
+
+DEFAULT_REFDATA_DIR = os.environ.get(
+    'IMPORT_REFDATA_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'rolloy-scm', 'refdata')
+)
+
+# Reference table -> its natural key
+REFERENCE_KEYS = {
+    'products': 'sku',
+    'channels': 'channel_code',
+    'warehouses': 'warehouse_code',
+    'suppliers': 'supplier_code',
+}
+
+# Column whose largest value tells whether a table changed
+UPDATED_COLUMN = 'updated_at'
+
+
+def default_refdata_path(target: str) -> str:
+    """Reference data file for one target database (e.g. its Supabase URL), shared by all scripts"""
+    name = hashlib.sha1(target.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(DEFAULT_REFDATA_DIR, f'{name}.json')
+
+
+class RestSource:
+    """Reads reference tables through a RestClient"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def state(self, table: str) -> Tuple[int, Optional[str]]:
+        return self.client.table_state(table, UPDATED_COLUMN)
+
+    def rows(self, table: str, columns: List[str], since: Optional[str] = None) -> List[dict]:
+        filters = {UPDATED_COLUMN: f'gte.{since}'} if since else None
+        return [row for page in self.client.fetch_pages(table, columns, filters=filters) for row in page]
+
+
+class SupabaseSource:
+    """Reads reference tables through a supabase-py client"""
+
+    def __init__(self, supabase, page_size: int = 1000):
+        self.supabase = supabase
+        self.page_size = page_size
+
+    def state(self, table: str) -> Tuple[int, Optional[str]]:
+        try:
+            result = self.supabase.table(table).select(UPDATED_COLUMN, count='exact') \
+                .order(UPDATED_COLUMN, desc=True, nullsfirst=False).limit(1).execute()
+        except Exception:
+            # No updated_at column: the count alone has to do
+            result = self.supabase.table(table).select('id', count='exact').limit(1).execute()
+            return result.count or 0, None
+        latest = result.data[0].get(UPDATED_COLUMN) if result.data else None
+        return result.count or 0, latest
+
+    def rows(self, table: str, columns: List[str], since: Optional[str] = None) -> List[dict]:
+        # The server may cap pages below page_size, so only an empty page ends the table
+        rows = []
+        while True:
+            query = self.supabase.table(table).select(', '.join(columns))
+            if since:
+                query = query.gte(UPDATED_COLUMN, since)
+            page = query.order('id').range(len(rows), len(rows) + self.page_size - 1).execute().data or []
+            if not page:
+                return rows
+            rows.extend(page)
+
+
+class ReferenceData:
+    """Natural key -> id maps of REFERENCE_KEYS tables, per run and (once opened) on disk"""
+
+    def __init__(self, source):
+        self.source = source
+        self.path = None
+        self._stored = {}   # table -> {'count', 'latest', 'ids'} as last seen on any run
+        self._checked = set()  # tables checked against the database in this run
+        self._lock = threading.Lock()
+        self._table_locks = {table: threading.Lock() for table in REFERENCE_KEYS}
+
+    def open(self, path: Optional[str]):
+        """Start from the maps stored at path; without a path every run reads the tables again"""
+        self.path = path
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"  ! Ignoring unreadable reference data {path}: {e}")
+            return
+        if data.get('version') != REFDATA_VERSION:
+            print(f"  ! Ignoring reference data {path}: unknown version")
+            return
+        with self._lock:
+            self._stored = {table: entry for table, entry in data.get('tables', {}).items()
+                            if table in REFERENCE_KEYS}
+
+    def ids(self, table: str) -> Dict[str, str]:
+        """
+        Natural key -> id of every row of table
+
+        The first call of a run (and the first after invalidate()) checks the
+        table's freshness; later calls answer from memory. If the table
+        cannot be read the error is printed and the map is empty, and the
+        next call tries again.
+        """
+        with self._table_locks[table]:
+            if table not in self._checked:
+                try:
+                    entry = self._refresh(table)
+                except Exception as e:
+                    print(f"  ! Could not read reference table {table}: {e}")
+                    return {}
+                with self._lock:
+                    self._stored[table] = entry
+                    self._checked.add(table)
+                self._save(table, entry)
+            with self._lock:
+                return dict(self._stored[table]['ids'])
+
+    def id(self, table: str, key: str) -> Optional[str]:
+        return self.ids(table).get(key)
+
+    def invalidate(self, table: str):
+        """This run wrote rows to table; check it again on the next lookup"""
+        with self._lock:
+            self._checked.discard(table)
+
+    def _refresh(self, table: str) -> dict:
+        key = REFERENCE_KEYS[table]
+        count, latest = self.source.state(table)
+        with self._lock:
+            stored = self._stored.get(table)
+
+        # Without an updated_at an equal count proves nothing: a delete and an insert keep it
+        if stored is not None and latest is not None \
+                and stored['count'] == count and stored['latest'] == latest:
+            print(f"  - {table}: {count} ids unchanged since the last run")
+            return stored
+
+        if stored is not None and latest is not None and stored['latest'] is not None \
+                and latest > stored['latest'] and count >= stored['count']:
+            rows = self.source.rows(table, ['id', key], since=stored['latest'])
+            updated = {row['id'] for row in rows}
+            # A row whose key changed drops its old key
+            ids = {k: v for k, v in stored['ids'].items() if v not in updated}
+            ids.update((row[key], row['id']) for row in rows if row[key] is not None)
+            if len(ids) == count:
+                print(f"  - {table}: {count} ids, {len(rows)} updated since the last run")
+                return {'count': count, 'latest': latest, 'ids': ids}
+
+        rows = self.source.rows(table, ['id', key])
+        ids = {row[key]: row['id'] for row in rows if row[key] is not None}
+        print(f"  - {table}: {len(ids)} ids read")
+        return {'count': len(rows), 'latest': latest, 'ids': ids}
+
+    def _save(self, table: str, entry: dict):
+        """
+        Write one table's entry atomically
+
+        Tables stored by other scripts or runs since this one opened the
+        file are kept, so runs against the same target share one file.
+        """
+        if not self.path:
+            return
+        with self._lock:
+            tables = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path, encoding='utf-8') as f:
+                        data = json.load(f)
+                    if data.get('version') == REFDATA_VERSION:
+                        tables = data.get('tables', {})
+                except (OSError, ValueError):
+                    pass
+            tables[table] = entry
+            try:
+                directory = os.path.dirname(os.path.abspath(self.path))
+                os.makedirs(directory, exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump({'version': REFDATA_VERSION, 'tables': tables}, f, ensure_ascii=False)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                print(f"  ! Could not write reference data {self.path}: {e}")
@@ -0,0 +1,440 @@
+"""
+Rolloy SCM - Pooled REST client for Supabase (PostgREST)
+
+One RestClient is shared by a whole import run. It keeps a keep-alive
+connection pool, caps the number of requests in flight, and exposes map()
+so a script can send independent rows of one table concurrently while still
+waiting for a table to finish before writing rows that reference it.
+fetch_pages()/fetch_all() read whole tables past PostgREST's response cap,
+several pages at a time.
+
+Requests that time out, are dropped or are answered 429/5xx are retried
+with backoff (see retry.py) before a call reports an error. Given a
+RunMetrics, every attempt is timed and counted, as are the retries and the
+rows that are sent again after a rejected batch.
+"""
+
+import os
+import json
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from scm_import.retry import CircuitBreaker, RetryPolicy, idempotent, send_with_retry
+
+DEFAULT_CONCURRENCY = int(os.environ.get('IMPORT_CONCURRENCY', 8))
+DEFAULT_TIMEOUT = 30
+# Rows per array request in insert_many()
+BULK_BATCH_SIZE = 1000
+# Rows asked for per page by fetch_pages(); the server may cap pages lower (db-max-rows)
+FETCH_PAGE_SIZE = 1000
+
+
+class FetchError(Exception):
+    """A page of a paginated read could not be fetched"""
+    pass
+
+
+class RestClient:
+    """Thread-safe PostgREST client with connection pooling and bounded concurrency"""
+
+    def __init__(self, base_url: str, api_key: str, concurrency: int = DEFAULT_CONCURRENCY,
+                 timeout: int = DEFAULT_TIMEOUT, conflict_ok: bool = False, metrics=None,
+                 retry: RetryPolicy = None, breaker: CircuitBreaker = None):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.timeout = timeout
+        self.retry = retry or RetryPolicy()
+        # One breaker for every request to the host
+        self.breaker = breaker or CircuitBreaker()
+        # RunMetrics of the run, if it is instrumented
+        self.metrics = metrics
+        # Treat 409 (duplicate) as an empty success instead of an error
+        self.conflict_ok = conflict_ok
+        self._lock = threading.Lock()
+        self._executor = None
+        self.set_concurrency(concurrency)
+
+    def set_concurrency(self, concurrency: int):
+        """Resize the connection pool and the in-flight limit"""
+        with self._lock:
+            self.concurrency = max(1, int(concurrency))
+            self._slots = threading.BoundedSemaphore(self.concurrency)
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency, pool_block=True)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update({
+                'apikey': self.api_key,
+                'Authorization': f'Bearer {self.api_key}',
+                'Content-Type': 'application/json',
+            })
+            self._session = session
+
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.concurrency, thread_name_prefix='rest'
+            )
+
+    def _send(self, method, table, data=None, params=None, prefer='return=representation', rows=None):
+        """
+        Send one request and return the raw response; raises on transport errors
+
+        Timeouts, dropped connections and 429/5xx answers are retried as the
+        client's RetryPolicy allows, plain inserts only when they were not
+        processed; the last answer (or error) is what the caller sees. rows is the number of rows in a pre-encoded body, for
+        the metrics.
+        """
+        url = f"{self.base_url}/rest/v1/{table}"
+        headers = {'Prefer': prefer}
+        body = data if isinstance(data, (bytes, str)) or data is None else json.dumps(data)
+        if rows is None:
+            rows = len(data) if isinstance(data, list) else int(isinstance(data, dict))
+        sent = len(body.encode() if isinstance(body, str) else body or b'')
+
+        def attempt():
+            # Backoff sleeps happen outside the slot, so they do not hold up other requests
+            with self._slots:
+                started = time.monotonic()
+                try:
+                    resp = self._session.request(
+                        method, url, headers=headers, params=params, data=body, timeout=self.timeout
+                    )
+                except Exception:
+                    if self.metrics is not None:
+                        self.metrics.request(method, table, 0, time.monotonic() - started, sent, 0, rows)
+                    raise
+                if self.metrics is not None:
+                    self.metrics.request(method, table, resp.status_code, time.monotonic() - started,
+                                         sent, len(resp.content), rows)
+                return resp
+
+        safe = idempotent(method, prefer, (params or {}).get('on_conflict'), data)
+        return send_with_retry(attempt, self.retry, self.breaker, f"{method} {table}",
+                               lambda: self._count_retries(method, table, 1), safe)
+
+    def request(self, method, table, data=None, params=None):
+        """
+        Send one request to /rest/v1/<table>
+
+        Returns the decoded JSON body ([] for an empty body), or None on error,
+        matching the api_request() contract the scripts were written against.
+        """
+        prefer = 'return=representation'
+        if method in ('POST', 'UPSERT'):
+            prefer = 'return=representation,resolution=merge-duplicates'
+            method = 'POST'
+
+        try:
+            resp = self._send(method, table, data, params, prefer)
+
+            if resp.status_code in [200, 201]:
+                return resp.json() if resp.text else []
+            elif resp.status_code == 409 and self.conflict_ok:
+                # Duplicate - that's OK
+                return []
+            else:
+                print(f"  ! API Error: {resp.status_code} - {resp.text[:200]}")
+        except Exception as e:
+            print(f"  ! Request Error: {e}")
+
+        if method in ('POST', 'PATCH', 'PUT') and isinstance(data, (list, dict)):
+            self._count('rows_failed', len(data) if isinstance(data, list) else 1)
+        return None
+
+    def insert_many(self, table, records, batch_size=BULK_BATCH_SIZE):
+        """
+        POST records as JSON arrays and return the rows PostgREST sends back
+
+        Arrays of up to batch_size rows go out concurrently, so a whole table
+        costs a handful of requests. Returned rows are not guaranteed to be in
+        input order; callers match them back on a natural key (batch_code,
+        po_id/sku/channel_code, ...). One bad row rejects its whole array, so a
+        rejected array is retried one row per request and only the bad rows
+        are lost, each reported like any request() error.
+        """
+        records = list(records)
+        prefer = 'return=representation,resolution=merge-duplicates'
+
+        def send(batch):
+            try:
+                resp = self._send('POST', table, batch, None, prefer)
+                if resp.status_code in [200, 201]:
+                    return resp.json() if resp.text else []
+                print(f"  ! Bulk insert into {table} rejected: {resp.status_code} - {resp.text[:200]}")
+            except Exception as e:
+                print(f"  ! Bulk insert into {table} failed: {e}")
+            return None
+
+        batches = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+        rows = []
+        retry = []
+        for batch, result in zip(batches, self.map(send, batches)):
+            if result is None:
+                retry.extend(batch)
+            else:
+                rows.extend(result)
+
+        if retry:
+            print(f"  ! Retrying {len(retry)} {table} rows one by one")
+            self._count_retries('POST', table, len(retry))
+            for result in self.map(lambda record: self.request('POST', table, record), retry):
+                if result:
+                    rows.extend(result)
+        return rows
+
+    def put_many(self, table, records):
+        """
+        Upsert records that already carry their primary key ('id')
+
+        Used with client-side stable ids: nothing needs to be read back, so
+        rows go out through upsert() with minimal responses. Records sharing
+        an id keep the first one, as a second insert of the same natural key
+        would have been rejected. Returns the records that were written.
+        """
+        unique = {}
+        for record in records:
+            unique.setdefault(record['id'], record)
+
+        _, failures = self.upsert(table, unique.values())
+        failed = set()
+        for record, error in failures:
+            print(f"  ! API Error: {table} {record['id']}: {error}")
+            failed.add(record['id'])
+        return [record for record in unique.values() if record['id'] not in failed]
+
+    def upsert(self, table, records, on_conflict=None, batcher=None):
+        """
+        Upsert records as JSON arrays, sizing each batch with an AdaptiveBatcher
+
+        A batch that fails is split in half and retried until the failing rows
+        are isolated, so one bad row never takes the rest of its batch with it.
+        A batch still throttled (429) or refused (503) once its retries are
+        used up is not split, as smaller batches would only add load.
+        Returns (success_count, failures) where failures is a list of
+        (record, error message) tuples, one per rejected row.
+        """
+        records = list(records)
+        batcher = batcher or AdaptiveBatcher()
+        params = {'on_conflict': on_conflict} if on_conflict else None
+        success = 0
+        failures = []
+
+        def send(batch):
+            """Returns (error, whether splitting the batch may help)"""
+            payload = json.dumps(batch)
+            started = time.monotonic()
+            split = True
+            try:
+                resp = self._send('POST', table, payload, params,
+                                  'return=minimal,resolution=merge-duplicates', rows=len(batch))
+                error = None if resp.status_code in [200, 201, 204] else f"{resp.status_code} - {resp.text[:200]}"
+                split = resp.status_code not in (429, 503)
+            except Exception as e:
+                error = str(e)
+            batcher.observe(len(batch), time.monotonic() - started, len(payload))
+            return error, split
+
+        def send_or_split(batch):
+            error, split = send(batch)
+            if error is None:
+                return len(batch), []
+            if len(batch) == 1 or not split:
+                return 0, [(record, error) for record in batch]
+            self._count_retries('POST', table, 2)
+            mid = len(batch) // 2
+            left_ok, left_failed = send_or_split(batch[:mid])
+            right_ok, right_failed = send_or_split(batch[mid:])
+            return left_ok + right_ok, left_failed + right_failed
+
+        pos = 0
+        while pos < len(records):
+            # One wave of up to `concurrency` batches at the current size
+            size = batcher.next_size()
+            wave = []
+            while pos < len(records) and len(wave) < self.concurrency:
+                wave.append(records[pos:pos + size])
+                pos += size
+
+            for ok, failed in self.map(send_or_split, wave):
+                success += ok
+                failures.extend(failed)
+
+        self._count('rows_failed', len(failures))
+        return success, failures
+
+    def fetch_pages(self, table, columns='*', order='id', page_size=FETCH_PAGE_SIZE, filters=None):
+        """
+        Yield the rows of table (columns only) one page at a time, in order
+
+        PostgREST caps every response at db-max-rows (1000 on Supabase), so a
+        single select GET of a larger table silently comes back incomplete.
+        The first page is asked for with an exact count; the rest are read
+        with limit/offset on order (which must be unique for pages not to
+        overlap), up to `concurrency` of them at once. A first page shorter
+        than page_size while more rows exist reveals the server's cap, which
+        then becomes the page size. filters ({column: 'gte.value', ...})
+        restrict the rows read. Raises FetchError when a page fails.
+        """
+        select = columns if isinstance(columns, str) else ','.join(columns)
+
+        def page(offset, limit, count=False):
+            params = {'select': select, 'order': order, 'limit': limit, 'offset': offset, **(filters or {})}
+            try:
+                resp = self._send('GET', table, None, params, 'count=exact' if count else 'return=representation')
+            except Exception as e:
+                raise FetchError(f"{table} rows {offset}-{offset + limit - 1}: {e}") from e
+            if resp.status_code not in (200, 206):
+                raise FetchError(f"{table} rows {offset}-{offset + limit - 1}: "
+                                 f"{resp.status_code} - {resp.text[:200]}")
+            # Content-Range: 0-999/12345, or */0; the total is '*' unless a count was asked for
+            total = resp.headers.get('Content-Range', '*/*').rpartition('/')[2]
+            return resp.json(), int(total) if total.isdigit() else None
+
+        rows, total = page(0, page_size, count=True)
+        yield rows
+        if not rows or (total is not None and len(rows) >= total):
+            return
+        size = len(rows)
+
+        if total is None:
+            # No count: read on until a short page
+            offset = size
+            while len(rows) == size:
+                rows, _ = page(offset, size)
+                if rows:
+                    yield rows
+                offset += size
+            return
+
+        offsets = list(range(size, total, size))
+        for i in range(0, len(offsets), self.concurrency):
+            for rows, _ in self.map(lambda offset: page(offset, size), offsets[i:i + self.concurrency]):
+                yield rows
+
+    def table_state(self, table, column='updated_at'):
+        """
+        (row count, largest value of column) of table, in one request
+
+        The value is None for an empty table or when every row's is NULL;
+        a table without the column is counted with a second request and
+        also gives None. Raises FetchError when the table cannot be read.
+        """
+        def first(select, order):
+            params = {'select': select, 'limit': 1}
+            if order:
+                params['order'] = order
+            try:
+                resp = self._send('GET', table, None, params, 'count=exact')
+            except Exception as e:
+                raise FetchError(f"{table} count: {e}") from e
+            total = resp.headers.get('Content-Range', '*/*').rpartition('/')[2]
+            return resp, int(total) if total.isdigit() else 0
+
+        resp, total = first(column, f'{column}.desc.nullslast')
+        if resp.status_code == 400:
+            # No such column
+            resp, total = first('id', None)
+            column = None
+        if resp.status_code not in (200, 206):
+            raise FetchError(f"{table} count: {resp.status_code} - {resp.text[:200]}")
+        rows = resp.json()
+        return total, rows[0].get(column) if rows and column else None
+
+    def fetch_all(self, table, columns='*', order='id', page_size=FETCH_PAGE_SIZE):
+        """
+        Every row of table (columns only) through fetch_pages()
+
+        Returns None, after printing the error, if any page failed, as
+        request() does, so a caller never builds a lookup map from part of a
+        table.
+        """
+        rows = []
+        try:
+            for page in self.fetch_pages(table, columns, order, page_size):
+                rows.extend(page)
+        except FetchError as e:
+            print(f"  ! Fetch Error: {e}")
+            return None
+        return rows
+
+    def map(self, func, items):
+        """
+        Run func(item) for every item on the shared worker pool
+
+        Results come back in input order. map() returns only when every call
+        has finished, so calling it once per table keeps parents ahead of
+        their children. Each call runs in a copy of the caller's context, so
+        its requests are charged to the caller's stage.
+        """
+        items = list(items)
+        if len(items) <= 1 or self.concurrency == 1:
+            return [func(item) for item in items]
+        contexts = [contextvars.copy_context() for _ in items]
+        return list(self._executor.map(lambda context, item: context.run(func, item), contexts, items))
+
+    def _count(self, field, n):
+        if self.metrics is not None and n:
+            self.metrics.count(field, n)
+
+    def _count_retries(self, method, table, n):
+        if self.metrics is not None:
+            self.metrics.retry(method, table, n)
+
+    def close(self):
+        """Release pooled connections and worker threads"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+            self._session.close()
+
+
+class AdaptiveBatcher:
+    """
+    Picks the next batch size from measured latency and payload size
+
+    Batches grow while requests come back well under target_seconds and
+    max_bytes, and shrink as soon as either limit is crossed. The size is
+    also capped so that the average row size times the batch size stays
+    under max_bytes.
+    """
+
+    def __init__(self, initial: int = 50, min_size: int = 1, max_size: int = 1000,
+                 target_seconds: float = 1.0, max_bytes: int = 1_000_000):
+        self.size = initial
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_seconds = target_seconds
+        self.max_bytes = max_bytes
+        self._row_bytes = None
+        self._lock = threading.Lock()
+
+    def next_size(self) -> int:
+        with self._lock:
+            size = self.size
+            if self._row_bytes:
+                size = min(size, int(self.max_bytes / self._row_bytes))
+            return max(self.min_size, min(self.max_size, size))
+
+    def observe(self, rows: int, seconds: float, nbytes: int):
+        """Record one finished request and adjust the batch size"""
+        if rows <= 0:
+            return
+        with self._lock:
+            row_bytes = nbytes / rows
+            if self._row_bytes is None:
+                self._row_bytes = row_bytes
+            else:
+                self._row_bytes = 0.8 * self._row_bytes + 0.2 * row_bytes
+
+            if seconds > self.target_seconds or nbytes > self.max_bytes:
+                self.size = max(self.min_size, self.size // 2)
+            elif seconds < self.target_seconds / 2 and nbytes < self.max_bytes / 2 and rows >= self.size:
+                self.size = min(self.max_size, self.size * 2)
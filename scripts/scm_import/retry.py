@@ -0,0 +1,300 @@
+"""
+Rolloy SCM - Retries, backoff and circuit breaking for import requests
+
+A request that times out, is dropped, or is answered 429/5xx is sent again
+instead of being given up on, so a throttled or briefly unavailable server
+slows an import down rather than losing its rows. That holds for
+idempotent requests only: a plain insert whose answer was lost may already
+be committed, so it is resent only when it was refused before being
+processed (429, 503, or a connection that was never made).
+
+RetryPolicy decides how often and how long to wait: exponential backoff
+with jitter, or the server's Retry-After when it sends one. CircuitBreaker
+is shared by every request of a run. A 429 with Retry-After pauses all
+senders, as a rate limit applies to the whole client, not just the request
+that hit it. Consecutive failures open the circuit: requests hold off for a
+cooldown, then a single probe decides whether the host is back.
+
+send_with_retry() is used by RestClient for every request; the httpx
+session of a supabase-py client gets the same treatment from
+resilient_supabase().
+"""
+
+import os
+import json
+import time
+import random
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional
+
+DEFAULT_MAX_RETRIES = int(os.environ.get('IMPORT_MAX_RETRIES', 5))
+
+# Statuses worth another attempt: throttling, and a server or gateway that is briefly unavailable
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+# Statuses that say a request was refused before it was processed, so even an insert may be resent
+REFUSED_STATUSES = frozenset({429, 503})
+
+# Transport errors raised before a request left the client (requests/urllib3 and httpx names)
+UNSENT_ERRORS = frozenset({'ConnectTimeout', 'ConnectTimeoutError', 'NewConnectionError',
+                           'ConnectError', 'PoolTimeout'})
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending when the circuit stayed open for longer than a request may wait"""
+    pass
+
+
+class RetryPolicy:
+    """How many times a request is retried and how long to wait before each retry"""
+
+    def __init__(self, max_retries: int = DEFAULT_MAX_RETRIES, base_delay: float = 0.5,
+                 max_delay: float = 30.0, max_retry_after: float = 120.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Longest Retry-After honoured; longer ones are cut to this
+        self.max_retry_after = max_retry_after
+        self._random = random.Random()
+
+    def should_retry(self, attempt: int, status: int, idempotent: bool = True) -> bool:
+        """
+        status 0 stands for a transport error (timeout, refused, reset)
+
+        A request that is not idempotent may have been committed when its
+        answer is a transport error or a 5xx other than 503, so it is only
+        retried when it was refused unprocessed.
+        """
+        if attempt >= self.max_retries:
+            return False
+        if not idempotent:
+            return status in REFUSED_STATUSES
+        return status == 0 or status in RETRY_STATUSES
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Seconds to wait before retry number attempt + 1
+
+        Without Retry-After: half of min(max_delay, base_delay * 2^attempt),
+        plus a random part of up to the other half, so concurrent senders
+        that failed together do not retry together. With Retry-After: that
+        long, plus up to base_delay of jitter.
+        """
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after) + self._random.uniform(0, self.base_delay)
+        ceiling = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return ceiling / 2 + self._random.uniform(0, ceiling / 2)
+
+
+class CircuitBreaker:
+    """
+    Shared health state of the target host
+
+    closed: requests go out. After `threshold` consecutive failures
+    (transport errors, 5xx) the circuit opens: requests wait `cooldown`
+    seconds, then it is half-open and one probe request goes out while the
+    others keep waiting. A probe that succeeds closes the circuit, one that
+    fails opens it again. A request that has waited `max_wait` seconds in
+    total gets CircuitOpenError.
+    """
+
+    def __init__(self, threshold: int = 10, cooldown: float = 15.0, max_wait: float = 300.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_wait = max_wait
+        self.state = CLOSED
+        self.opened = 0  # how many times the circuit opened
+        self._failures = 0
+        self._opened_at = 0.0
+        self._paused_until = 0.0
+        self._probing = False
+        self._cond = threading.Condition()
+
+    def before_request(self):
+        """Block until a request may be sent"""
+        with self._cond:
+            deadline = time.monotonic() + self.max_wait
+            while True:
+                now = time.monotonic()
+                if self.state == OPEN and now >= self._opened_at + self.cooldown:
+                    self.state = HALF_OPEN
+                    self._probing = False
+
+                if now >= self._paused_until:
+                    if self.state == CLOSED:
+                        return
+                    if self.state == HALF_OPEN and not self._probing:
+                        self._probing = True
+                        return
+
+                if now >= deadline:
+                    raise CircuitOpenError(f"circuit {self.state} for over {self.max_wait:.0f}s")
+                if now < self._paused_until:
+                    wake = self._paused_until
+                elif self.state == OPEN:
+                    wake = self._opened_at + self.cooldown
+                else:
+                    # Half-open with a probe in flight; woken when it returns
+                    wake = now + 1.0
+                self._cond.wait(min(wake, deadline) - now)
+
+    def record(self, status: int):
+        """Outcome of a request: 0 for a transport error, else the HTTP status"""
+        with self._cond:
+            # Whatever a half-open probe got, the next request may probe
+            self._probing = False
+            if status == 0 or status >= 500:
+                self._failures += 1
+                if self.state == HALF_OPEN or (self.state == CLOSED and self._failures >= self.threshold):
+                    self._open()
+            elif status != 429:
+                # Throttling says nothing about the host's health; anything else means it is up
+                self._failures = 0
+                if self.state != CLOSED:
+                    print("  - Circuit closed: requests are going through again")
+                    self.state = CLOSED
+            self._cond.notify_all()
+
+    def pause(self, seconds: float):
+        """Hold back every request for seconds"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _open(self):
+        # Callers hold the lock
+        if self.state != OPEN:
+            self.opened += 1
+            print(f"  ! Circuit open after {self._failures} failed requests; "
+                  f"pausing requests for {self.cooldown:g}s")
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+
+
+def retry_after(headers) -> Optional[float]:
+    """Seconds asked for by a Retry-After header (delay-seconds or HTTP-date), if any"""
+    value = headers.get('Retry-After') if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def idempotent(method: str, prefer: Optional[str] = None, on_conflict: Optional[str] = None,
+               body=None) -> bool:
+    """
+    Whether sending a PostgREST request twice has the same effect as once
+
+    GET, PATCH and DELETE by filter are. A POST is when it merges or
+    ignores duplicates (Prefer: resolution=...) on on_conflict, or on the
+    primary key with every row carrying its 'id'; a plain insert is not.
+    body may be rows or their JSON encoding.
+    """
+    if method.upper() != 'POST':
+        return True
+    if 'resolution=' not in (prefer or ''):
+        return False
+    if on_conflict:
+        return True
+    if isinstance(body, (bytes, str)):
+        try:
+            body = json.loads(body)
+        except ValueError:
+            return False
+    rows = body if isinstance(body, list) else [body]
+    return all(isinstance(row, dict) and row.get('id') is not None for row in rows)
+
+
+def never_sent(error: BaseException) -> bool:
+    """Whether a transport error happened before the request reached the server"""
+    seen = set()
+    pending = [error]
+    while pending:
+        e = pending.pop()
+        if not isinstance(e, BaseException) or id(e) in seen:
+            continue
+        seen.add(id(e))
+        if type(e).__name__ in UNSENT_ERRORS:
+            return True
+        # requests wraps urllib3's MaxRetryError, whose reason is the underlying error
+        pending.extend([e.__cause__, e.__context__, getattr(e, 'reason', None), *e.args])
+    return False
+
+
+def send_with_retry(send: Callable[[], object], policy: RetryPolicy, breaker: CircuitBreaker,
+                    describe: str, on_retry: Optional[Callable[[], None]] = None,
+                    idempotent: bool = True):
+    """
+    Call send() until its response is not worth retrying, and return that response
+
+    send() returns a response with status_code and headers, or raises on a
+    transport error. The last response is returned once retries run out;
+    the last transport error is raised. on_retry is called before every
+    retry, e.g. to count it. A request that is not idempotent is only
+    retried when it never reached the server or was refused unprocessed.
+    """
+    attempt = 0
+    while True:
+        breaker.before_request()
+        after = None
+        try:
+            resp = send()
+        except Exception as e:
+            breaker.record(0)
+            if not policy.should_retry(attempt, 0, idempotent or never_sent(e)):
+                raise
+            reason = f"{type(e).__name__}: {e}"
+        else:
+            breaker.record(resp.status_code)
+            if not policy.should_retry(attempt, resp.status_code, idempotent):
+                return resp
+            reason = f"HTTP {resp.status_code}"
+            after = retry_after(resp.headers)
+            if after is not None and resp.status_code == 429:
+                breaker.pause(min(after, policy.max_retry_after))
+
+        wait = policy.delay(attempt, after)
+        attempt += 1
+        if on_retry is not None:
+            on_retry()
+        print(f"  ! {describe}: {reason[:200]}; retry {attempt}/{policy.max_retries} in {wait:.1f}s")
+        time.sleep(wait)
+
+
+def resilient_httpx(session, policy: RetryPolicy, breaker: CircuitBreaker, metrics=None):
+    """Retry the requests of an httpx.Client through send_with_retry()"""
+    # An instance-level send (instrument_httpx) is kept; otherwise the class's is resolved per call
+    send = session.__dict__.get('send') or (lambda request, *args, **kwargs:
+                                            type(session).send(session, request, *args, **kwargs))
+
+    def retrying_send(request, *args, **kwargs):
+        table = request.url.path.rstrip('/').rsplit('/', 1)[-1]
+        on_retry = (lambda: metrics.retry(request.method, table)) if metrics is not None else None
+        safe = idempotent(request.method, request.headers.get('prefer'),
+                          request.url.params.get('on_conflict'), request.content)
+        return send_with_retry(lambda: send(request, *args, **kwargs), policy, breaker,
+                               f"{request.method} {table}", on_retry, safe)
+
+    session.send = retrying_send
+
+
+def resilient_supabase(client, policy: Optional[RetryPolicy] = None,
+                       breaker: Optional[CircuitBreaker] = None, metrics=None):
+    """Retry the PostgREST calls of a supabase-py client"""
+    session = getattr(getattr(client, 'postgrest', None), 'session', None)
+    if session is None:
+        print("  ! Retries unavailable for this supabase client version")
+        return
+    resilient_httpx(session, policy or RetryPolicy(), breaker or CircuitBreaker(), metrics)
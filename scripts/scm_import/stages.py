@@ -0,0 +1,138 @@
+"""
+Rolloy SCM - Dependency-aware scheduler for import stages
+
+An import run is a handful of stages (master data, forecasts, actuals,
+purchase orders, shipments) of which only some depend on each other.
+Pipeline runs every stage as soon as the stages it declares `after` have
+finished, so independent stages overlap and a run takes about as long as
+its longest dependency chain - the critical path - rather than the sum of
+all stages. report() prints each stage's timing and that path.
+
+Stages share the script's RestClient, Supabase client and WorkbookReader,
+all of which are safe to use from several threads. Given the run's
+RunMetrics, each stage runs inside metrics.stage() so its rows and
+requests are counted against it.
+"""
+
+import time
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+class Stage:
+    """One named step of an import and the stages it has to wait for"""
+
+    def __init__(self, name: str, func: Callable[[], object], after: Sequence[str] = ()):
+        self.name = name
+        self.func = func
+        self.after = tuple(after)
+
+
+class Pipeline:
+    """Runs stages in dependency order, independent ones concurrently"""
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+        self.stages: Dict[str, Stage] = {}
+        self.timings: Dict[str, Tuple[float, float]] = {}  # name -> (start, end), seconds into the run
+        self.failed: Dict[str, BaseException] = {}
+        self.skipped: List[str] = []
+        self.wall_time = 0.0
+
+    def add(self, name: str, func: Callable[[], object], after: Sequence[str] = ()):
+        """Declare a stage; its dependencies must already have been added"""
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        unknown = [dep for dep in after if dep not in self.stages]
+        if unknown:
+            # Requiring dependencies first also rules out cycles
+            raise ValueError(f"Stage {name} depends on unknown stages: {unknown}")
+        self.stages[name] = Stage(name, func, after)
+
+    def run(self, parallel: bool = True):
+        """
+        Run every stage once its dependencies are done
+
+        With parallel=False stages run one at a time in the order they were
+        added. A stage that raises is reported, the stages depending on it
+        are skipped, the others still run, and the first error is raised once
+        nothing is left to run.
+        """
+        pending = list(self.stages.values())
+        running = {}  # future -> stage
+        done = set()
+        started = time.monotonic()
+
+        def call(stage):
+            begin = time.monotonic() - started
+            try:
+                with self.metrics.stage(stage.name) if self.metrics is not None else nullcontext():
+                    stage.func()
+            finally:
+                self.timings[stage.name] = (begin, time.monotonic() - started)
+
+        with ThreadPoolExecutor(max_workers=len(pending) if parallel else 1,
+                                thread_name_prefix='stage') as pool:
+            while pending or running:
+                for stage in list(pending):
+                    if any(dep in self.failed or dep in self.skipped for dep in stage.after):
+                        print(f"  ! Skipping stage {stage.name}: a stage it depends on failed")
+                        self.skipped.append(stage.name)
+                        pending.remove(stage)
+                    elif all(dep in done for dep in stage.after) and (parallel or not running):
+                        running[pool.submit(call, stage)] = stage
+                        pending.remove(stage)
+
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage = running.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        done.add(stage.name)
+                    else:
+                        print(f"  ! Stage {stage.name} failed: {error}")
+                        self.failed[stage.name] = error
+
+        self.wall_time = time.monotonic() - started
+        if self.failed:
+            raise next(iter(self.failed.values()))
+
+    def critical_path(self) -> Tuple[List[str], float]:
+        """The chain of finished stages with the largest total run time"""
+        chain: Dict[str, Tuple[float, Optional[str]]] = {}  # name -> (chain length, previous stage)
+        for name, stage in self.stages.items():
+            if name not in self.timings:
+                continue
+            start, end = self.timings[name]
+            before = max(((chain[dep][0], dep) for dep in stage.after if dep in chain), default=(0.0, None))
+            chain[name] = (before[0] + end - start, before[1])
+
+        if not chain:
+            return [], 0.0
+        last = max(chain, key=lambda name: chain[name][0])
+        length = chain[last][0]
+        path = []
+        while last is not None:
+            path.append(last)
+            last = chain[last][1]
+        return path[::-1], length
+
+    def report(self):
+        """Print each stage's time and the critical path"""
+        print("\nStage timings:")
+        width = max((len(name) for name in self.stages), default=0)
+        for name in self.stages:
+            if name in self.timings:
+                start, end = self.timings[name]
+                status = ' (failed)' if name in self.failed else ''
+                print(f"  - {name:<{width}}  {end - start:7.2f}s  [{start:7.2f}s - {end:7.2f}s]{status}")
+            else:
+                print(f"  - {name:<{width}}  skipped")
+
+        path, length = self.critical_path()
+        total = sum(end - start for start, end in self.timings.values())
+        print(f"Critical path: {' -> '.join(path)} ({length:.2f}s)")
+        print(f"Wall time {self.wall_time:.2f}s for {total:.2f}s of stage time")
@@ -0,0 +1,105 @@
+"""
+Rolloy SCM - Streaming parse -> transform -> upload with bounded queues
+
+A stage that reads a sheet chunk by chunk used to parse a chunk, turn it
+into records and upload them before parsing the next one, so the network
+sat idle while openpyxl worked and the CPU sat idle during the upload.
+stream() runs the three steps on their own threads, joined by queues of at
+most `depth` items: chunk N+1 is parsed and transformed while chunk N is
+being uploaded. When the upload falls behind the queues fill up and the
+parser blocks, so no more than about 2 * depth + 3 chunks are held at once
+however long the sheet is.
+
+The upload runs on the calling thread, in order, so journal and manifest
+bookkeeping stays as it was. The parse and transform threads run in copies
+of the caller's context, so their rows are counted against the caller's
+stage. The first error of any step stops the others and is raised by
+stream().
+"""
+
+import queue
+import threading
+import contextvars
+from typing import Callable, Iterable, Iterator, List
+
+# Chunks waiting between two steps
+DEFAULT_QUEUE_DEPTH = 2
+
+_DONE = object()
+
+
+class _Failed:
+    """An error raised by an upstream step, passed down in its place"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def _put(out: queue.Queue, item, stop: threading.Event) -> bool:
+    """Put item once there is room; False if the stream was stopped meanwhile"""
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _drain(source: queue.Queue, stop: threading.Event) -> Iterator:
+    """Items of a queue up to the end marker or a stop; an upstream error is raised here"""
+    while not stop.is_set():
+        try:
+            item = source.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        if isinstance(item, _Failed):
+            raise item.error
+        yield item
+
+
+def _start(name: str, items: Callable[[], Iterable], out: queue.Queue, stop: threading.Event) -> threading.Thread:
+    """Feed items() into out on a new thread, in a copy of the caller's context"""
+    def feed():
+        produced = items()
+        try:
+            for item in produced:
+                if not _put(out, item, stop):
+                    return
+            _put(out, _DONE, stop)
+        except BaseException as e:
+            _put(out, _Failed(e), stop)
+        finally:
+            close = getattr(produced, 'close', None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(feed,), name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def stream(chunks: Iterable, transform: Callable, upload: Callable,
+           depth: int = DEFAULT_QUEUE_DEPTH) -> List:
+    """
+    upload(transform(chunk)) for every chunk, the three steps overlapping
+
+    chunks is iterated on a parser thread (typically WorkbookReader.
+    iter_sheet()), transform runs on a second thread and upload on the
+    calling one. Returns upload's results in chunk order.
+    """
+    stop = threading.Event()
+    parsed = queue.Queue(maxsize=depth)
+    built = queue.Queue(maxsize=depth)
+    threads = [
+        _start('parse', lambda: iter(chunks), parsed, stop),
+        _start('transform', lambda: (transform(chunk) for chunk in _drain(parsed, stop)), built, stop),
+    ]
+    try:
+        return [upload(item) for item in _drain(built, stop)]
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,253 @@
+"""
+Rolloy SCM - Workbook reader for the import scripts
+
+WorkbookReader stands in for pd.ExcelFile. read_sheet() loads a whole sheet
+exactly as pd.read_excel() did; iter_sheet() can instead stream a sheet in
+fixed-size row chunks from openpyxl's read-only row iterator, so peak memory
+follows the chunk size rather than the sheet size.
+
+Both accept a column spec ({column: dtype}) naming the only columns the
+caller uses. Other columns - the planning workbooks carry many helper and
+formula columns - are dropped while reading, and the kept ones get the
+declared dtype instead of whatever pandas would infer. Reads with a spec
+are served from a SheetCache when the reader has one.
+
+One reader can be shared by import stages running on different threads:
+each read, and each chunk of a streamed sheet, holds the reader's lock, as
+neither openpyxl nor pd.ExcelFile is thread-safe. Given a RunMetrics, the
+rows and parse time of every read or chunk are recorded per sheet.
+"""
+
+import time
+import threading
+from datetime import datetime
+from operator import itemgetter
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+from scm_import.cache import SheetCache, iter_frames
+
+# Column dtypes for a column spec
+TEXT = 'str'        # identifiers and free text; integral numbers lose their '.0'
+NUMBER = 'float64'  # quantities and amounts; non-numeric cells become NaN
+RAW = 'object'      # cells as read (dates, which parse_date() handles per cell)
+
+ColumnSpec = Dict[str, str]
+
+# Rows per chunk the import scripts stream the weekly sheets in (0: whole sheets)
+DEFAULT_CHUNK_ROWS = 1000
+
+
+class WorkbookReader:
+    """Read-only access to one .xlsx file, whole sheets or row chunks"""
+
+    def __init__(self, path: str, chunk_size: Optional[int] = None,
+                 cache: Optional[SheetCache] = None, metrics=None):
+        self.path = path
+        self.chunk_size = chunk_size
+        # Reads with a column spec go through the cache when one is given
+        self.cache = cache
+        self.metrics = metrics
+        self._excel = None
+        self._workbook = None
+        self._lock = threading.RLock()
+
+    @property
+    def sheet_names(self) -> List[str]:
+        with self._lock:
+            return self._get_workbook().sheetnames
+
+    def _get_workbook(self):
+        if self._workbook is None:
+            self._workbook = load_workbook(self.path, read_only=True, data_only=True)
+        return self._workbook
+
+    def _get_excel(self):
+        if self._excel is None:
+            self._excel = pd.ExcelFile(self.path)
+        return self._excel
+
+    def read_sheet(self, sheet_name: str, columns: Optional[ColumnSpec] = None) -> pd.DataFrame:
+        """
+        Load a whole sheet with pd.read_excel
+
+        With a column spec only those columns are kept (missing ones are
+        simply absent) and each is converted to its declared dtype.
+        """
+        started = time.monotonic()
+        with self._lock:
+            if columns is None:
+                df = pd.read_excel(self._get_excel(), sheet_name=sheet_name)
+            else:
+                # Without a chunk size exactly one frame comes back
+                df = list(self._read(sheet_name, columns, None))[0]
+        self._record(sheet_name, df, started)
+        return df
+
+    def iter_sheet(self, sheet_name: str, chunk_size: Optional[int] = None,
+                   columns: Optional[ColumnSpec] = None) -> Iterator[pd.DataFrame]:
+        """
+        Yield a sheet as DataFrames of at most chunk_size rows
+
+        Without a chunk size (argument or reader default) the whole sheet is
+        yielded once via read_sheet(). Otherwise rows are pulled lazily from
+        the read-only worksheet; the first row is the header, and fully empty
+        rows are skipped. A column spec is applied as in read_sheet(), with
+        unused cells dropped from each row before it is buffered.
+        """
+        chunk_size = chunk_size or self.chunk_size
+        if columns is not None:
+            frames = self._read(sheet_name, columns, chunk_size)
+        elif chunk_size:
+            frames = self._stream(sheet_name, chunk_size, None)
+        else:
+            # read_sheet() records its own read
+            yield self.read_sheet(sheet_name)
+            return
+
+        while True:
+            # Parse the next chunk under the lock, hand it out without it
+            started = time.monotonic()
+            with self._lock:
+                df = next(frames, None)
+            if df is None:
+                return
+            self._record(sheet_name, df, started)
+            yield df
+
+    def _record(self, sheet_name: str, df: pd.DataFrame, started: float):
+        if self.metrics is not None:
+            self.metrics.sheet_read(sheet_name, len(df), time.monotonic() - started)
+
+    def _read(self, sheet_name: str, columns: ColumnSpec,
+              chunk_size: Optional[int]) -> Iterator[pd.DataFrame]:
+        """
+        Typed frames of a sheet, from the cache when the workbook is cached
+
+        On a cache miss the parsed frames are written to the cache as they
+        are yielded. RAW cells are stored as text (dates as
+        'YYYY-MM-DD HH:MM:SS', which parse_date() reads back unchanged), and
+        the frames handed out match what a later cached read returns.
+        """
+        if self.cache is None:
+            yield from self._parse(sheet_name, columns, chunk_size)
+            return
+
+        entry = self.cache.entry(self.path, sheet_name, columns)
+        table = self.cache.load(entry)
+        if table is not None:
+            yield from iter_frames(table, chunk_size)
+            return
+
+        frames = (_raw_as_text(df, columns) for df in self._parse(sheet_name, columns, chunk_size))
+        yield from self.cache.write(entry, frames, columns)
+
+    def _parse(self, sheet_name: str, columns: ColumnSpec,
+               chunk_size: Optional[int]) -> Iterator[pd.DataFrame]:
+        if chunk_size:
+            yield from self._stream(sheet_name, chunk_size, columns)
+            return
+        df = pd.read_excel(self._get_excel(), sheet_name=sheet_name,
+                           usecols=lambda col: col in columns, dtype=object)
+        yield _apply_dtypes(df, columns)
+
+    def _stream(self, sheet_name: str, chunk_size: int,
+                columns: Optional[ColumnSpec]) -> Iterator[pd.DataFrame]:
+        """Rows of the read-only worksheet, chunk_size at a time"""
+        ws = self._get_workbook()[sheet_name]
+        # Dimension records in exported workbooks are often wrong; scan all rows
+        ws.reset_dimensions()
+        rows = ws.iter_rows(values_only=True)
+
+        header = next(rows, None)
+        if header is None:
+            return
+        names = _header_names(header)
+        width = len(names)
+        keep = [i for i, name in enumerate(names) if columns is None or name in columns]
+        if not keep:
+            return
+        names = [names[i] for i in keep]
+        project = itemgetter(*keep) if len(keep) > 1 else lambda row: (row[keep[0]],)
+
+        def frame(chunk):
+            if columns is None:
+                return pd.DataFrame.from_records(chunk, columns=names)
+            return _apply_dtypes(pd.DataFrame(np.array(chunk, dtype=object), columns=names), columns)
+
+        chunk = []
+        for row in rows:
+            # Rows are ragged once dimensions are reset; pad or trim to the header
+            row = project(tuple(row[:width]) + (None,) * (width - len(row)))
+            if all(v is None for v in row):
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield frame(chunk)
+                chunk = []
+        if chunk:
+            yield frame(chunk)
+
+    def close(self):
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+        if self._excel is not None:
+            self._excel.close()
+            self._excel = None
+
+
+def _apply_dtypes(df: pd.DataFrame, columns: ColumnSpec) -> pd.DataFrame:
+    """Convert object columns read from a sheet to their declared dtypes"""
+    for col in df.columns:
+        dtype = columns.get(col, RAW)
+        if dtype == NUMBER:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+        elif dtype == TEXT:
+            df[col] = _text_column(df[col])
+    return df
+
+
+def _raw_as_text(df: pd.DataFrame, columns: ColumnSpec) -> pd.DataFrame:
+    """Render RAW columns as text so a frame fits the cache's Arrow schema"""
+    for col in df.columns:
+        if columns.get(col, RAW) == RAW:
+            df[col] = _text_column(df[col])
+    return df
+
+
+def _text_column(series: pd.Series) -> pd.Series:
+    """Cells as Python str in an object column, missing cells left as they are"""
+    return series.map(_cell_text, na_action='ignore').astype(object)
+
+
+def _cell_text(value) -> str:
+    """str() of a cell, without the '.0' Excel adds to whole numbers"""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return str(value)
+
+
+def _header_names(header) -> List:
+    """Column names as pd.read_excel builds them: 'Unnamed: N' for blanks, '.N' for repeats"""
+    names = []
+    seen = {}
+    for i, value in enumerate(header):
+        name = f'Unnamed: {i}' if value is None else value
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+
+    # Trailing blank header cells carry no data
+    while names and isinstance(names[-1], str) and names[-1].startswith('Unnamed: '):
+        names.pop()
+    return names
+